@@ -0,0 +1,112 @@
+"""
+Reports the overhead the plugin adds to every test, in microseconds per test.
+
+Runs a generated suite of trivial tests (each using one function-scoped
+fixture) without the plugin, with the plugin but no DSN, and with the plugin
+reporting to a client that discards everything.
+
+    python benchmarks/bench_overhead.py [--tests N] [--runs N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+CONFTEST = """
+import time
+
+import pytest
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_collection_finish(session):
+    session.config._bench_start = time.perf_counter()
+
+
+def pytest_sessionfinish(session):
+    elapsed = time.perf_counter() - session.config._bench_start
+    with open({result_path!r}, "w") as f:
+        f.write(repr(elapsed))
+"""
+
+TEST_MODULE = """
+import pytest
+{marker}
+
+@pytest.fixture
+def value():
+    return 1
+
+"""
+
+TEST_FUNCTION = """
+def test_{i}(value):
+    assert value == 1
+"""
+
+ACTIVE_MARKER = """
+import pytest_sentry
+pytestmark = pytest.mark.sentry_client(
+    pytest_sentry.Client(transport=lambda envelope: None)
+)
+"""
+
+
+def _write_suite(directory, tests, marker):
+    result_path = os.path.join(directory, "result")
+    with open(os.path.join(directory, "conftest.py"), "w") as f:
+        f.write(CONFTEST.format(result_path=result_path))
+    with open(os.path.join(directory, "test_generated.py"), "w") as f:
+        f.write(TEST_MODULE.format(marker=marker))
+        for i in range(tests):
+            f.write(TEST_FUNCTION.format(i=i))
+    return result_path
+
+
+def _run(tests, runs, marker, extra_args, env):
+    timings = []
+    with tempfile.TemporaryDirectory() as directory:
+        result_path = _write_suite(directory, tests, marker)
+        for _ in range(runs):
+            subprocess.run(
+                [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider"]
+                + extra_args
+                + [directory],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                env=env,
+                check=False,
+            )
+            with open(result_path) as f:
+                timings.append(float(f.read()) / tests)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tests", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.pop("PYTEST_SENTRY_DSN", None)
+
+    baseline = _run(args.tests, args.runs, "", ["-p", "no:sentry"], env)
+    noop = _run(args.tests, args.runs, "", [], env)
+    active = _run(args.tests, args.runs, ACTIVE_MARKER, [], env)
+
+    print("without plugin   {:8.1f} us/test".format(baseline * 1e6))
+    for label, value in (("plugin, no DSN", noop), ("plugin, active", active)):
+        print(
+            "{:<16} {:8.1f} us/test  (overhead {:8.1f} us/test)".format(
+                label, value * 1e6, (value - baseline) * 1e6
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Measures in-app classification of large synthetic stack traces, as produced
+by failures deep inside pytest and pluggy with chained exceptions.
+
+    python benchmarks/bench_stacktrace.py [--frames N] [--exceptions N] [--events N]
+"""
+
+import argparse
+import copy
+import time
+
+from pytest_sentry.integration import PytestIntegration, _process_stacktrace
+
+
+MODULES = [
+    "_pytest.runner",
+    "_pytest.python",
+    "pluggy._callers",
+    "pluggy._manager",
+    "pytest_sentry.hooks",
+    "wrapt.wrappers",
+    "myapp.models",
+    "myapp.views",
+    "tests.test_views",
+]
+
+
+def _make_event(frames, exceptions):
+    return {
+        "exception": {
+            "values": [
+                {
+                    "stacktrace": {
+                        "frames": [
+                            {
+                                "module": MODULES[i % len(MODULES)],
+                                "abs_path": "/src/{}.py".format(i % len(MODULES)),
+                            }
+                            for i in range(frames)
+                        ]
+                    }
+                }
+                for _ in range(exceptions)
+            ]
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--exceptions", type=int, default=3)
+    parser.add_argument("--events", type=int, default=1000)
+    args = parser.parse_args()
+
+    integration = PytestIntegration(in_app_exclude=["_pytest", "pytest", "pluggy", "wrapt"])
+    events = [_make_event(args.frames, args.exceptions) for _ in range(args.events)]
+    events_copy = copy.deepcopy(events)
+
+    start = time.perf_counter()
+    for event in events:
+        for exception in event["exception"]["values"]:
+            _process_stacktrace(exception["stacktrace"], integration)
+    elapsed = time.perf_counter() - start
+
+    prefixes = ("_pytest.", "pytest.", "pluggy.", "wrapt.")
+    start = time.perf_counter()
+    for event in events_copy:
+        for exception in event["exception"]["values"]:
+            for frame in exception["stacktrace"]["frames"]:
+                frame["in_app"] = not frame["module"].startswith(prefixes)
+    uncached = time.perf_counter() - start
+
+    frames = args.frames * args.exceptions * args.events
+    print("cached     {:8.1f} ns/frame".format(elapsed / frames * 1e9))
+    print("uncached   {:8.1f} ns/frame".format(uncached / frames * 1e9))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Compares the wall-clock time of `pytest --collect-only` with and without the
+plugin loaded.
+
+    python benchmarks/bench_startup.py [--runs N] [pytest args...]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+def _time_collect(extra_args, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "pytest", "--collect-only", "-q"] + extra_args,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=False,
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    args, pytest_args = parser.parse_known_args()
+
+    without = _time_collect(["-p", "no:sentry"] + pytest_args, args.runs)
+    with_plugin = _time_collect(pytest_args, args.runs)
+
+    for label, timings in (("without plugin", without), ("with plugin", with_plugin)):
+        print(
+            "{:<16} median {:8.1f} ms  min {:8.1f} ms".format(
+                label, statistics.median(timings) * 1000, min(timings) * 1000
+            )
+        )
+
+    print(
+        "plugin overhead  median {:8.1f} ms".format(
+            (statistics.median(with_plugin) - statistics.median(without)) * 1000
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
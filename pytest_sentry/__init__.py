@@ -1,9 +1,24 @@
 from .client import Client  # noqa: F401
 from .fixtures import sentry_test_scope  # noqa: F401
 from .hooks import (  # noqa: F401
+    pytest_addoption,
+    pytest_collection,
+    pytest_collection_finish,
+    pytest_configure,
+    pytest_configure_node,
+    pytest_fixture_post_finalizer,
     pytest_fixture_setup,
     pytest_load_initial_conftests,
+    pytest_make_collect_report,
+    pytest_pyfunc_call,
     pytest_runtest_call,
     pytest_runtest_makereport,
     pytest_runtest_protocol,
+    pytest_runtest_setup,
+    pytest_runtest_teardown,
+    pytest_sessionfinish,
+    pytest_sessionstart,
+    pytest_terminal_summary,
+    pytest_testnodedown,
 )
+from .integration import get_environ_tags  # noqa: F401
@@ -0,0 +1,126 @@
+import argparse
+import os
+import sys
+import time
+
+
+def _upload_spool(args):
+    from .spool import upload_spool
+
+    if not args.spool_dir:
+        sys.exit("No spool directory given and PYTEST_SENTRY_SPOOL_DIR is not set")
+
+    options = {
+        name: getattr(args, name)
+        for name in ("http_proxy", "https_proxy", "ca_certs")
+        if getattr(args, name) is not None
+    }
+    uploaded, remaining = upload_spool(args.spool_dir, dsn=args.dsn, timeout=args.timeout, options=options)
+    print("Uploaded {} envelopes, {} remaining".format(uploaded, remaining))
+    return 1 if remaining else 0
+
+
+def _get_store(args):
+    from .runstore import RunStore
+
+    if not args.store:
+        sys.exit("No run store given and PYTEST_SENTRY_STORE_PATH is not set")
+    if not os.path.exists(args.store):
+        sys.exit("Run store {} does not exist".format(args.store))
+    return RunStore(args.store)
+
+
+def _format_duration(duration):
+    return "{:9.3f}s".format(duration) if duration is not None else "         -"
+
+
+def _slowest_fixtures(args):
+    rows = _get_store(args).slowest_fixtures(runs=args.runs, limit=args.limit)
+    print("   per run       mean        max  setups  fixture")
+    for baseid, argname, scope, setups, mean, maximum, per_run in rows:
+        print("{} {} {} {:7d}  {} ({})".format(
+            _format_duration(per_run),
+            _format_duration(mean),
+            _format_duration(maximum),
+            setups,
+            "{}::{}".format(baseid, argname) if baseid else argname,
+            scope,
+        ))
+    return 0
+
+
+def _flakiest(args):
+    rows = _get_store(args).flakiest_tests(runs=args.runs, limit=args.limit)
+    print(" flaky   runs  reruns  failed  test")
+    for nodeid, runs, flaky, reruns, failed in rows:
+        print("{:6.0%} {:6d} {:7d} {:7d}  {}".format(flaky / runs, runs, reruns, failed, nodeid))
+    return 0
+
+
+def _trend(args):
+    rows = _get_store(args).trend(args.nodeid, runs=args.runs)
+    if not rows:
+        sys.exit("No runs of {} in the run store".format(args.nodeid))
+
+    print("started                  setup        call    teardown  reruns  outcome")
+    for started, outcome, reruns, setup, call, teardown in rows:
+        print("{}  {}  {}  {} {:7d}  {}".format(
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started)),
+            _format_duration(setup),
+            _format_duration(call),
+            _format_duration(teardown),
+            reruns,
+            outcome,
+        ))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pytest_sentry")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    upload = subparsers.add_parser(
+        "upload-spool", help="Upload envelopes spooled with PYTEST_SENTRY_SPOOL_DIR"
+    )
+    upload.add_argument(
+        "spool_dir", nargs="?", default=os.environ.get("PYTEST_SENTRY_SPOOL_DIR")
+    )
+    upload.add_argument("--dsn", help="Upload to this DSN instead of the one the envelopes were spooled for")
+    upload.add_argument("--timeout", type=float, default=30)
+    upload.add_argument("--http-proxy", help="Like the `http_proxy` client option (default: HTTP_PROXY)")
+    upload.add_argument("--https-proxy", help="Like the `https_proxy` client option (default: HTTPS_PROXY)")
+    upload.add_argument("--ca-certs", help="Like the `ca_certs` client option (default: SSL_CERT_FILE)")
+    upload.set_defaults(func=_upload_spool)
+
+    store_parent = argparse.ArgumentParser(add_help=False)
+    store_parent.add_argument(
+        "--store",
+        default=os.environ.get("PYTEST_SENTRY_STORE_PATH"),
+        help="The run store recorded with --sentry-store (default: PYTEST_SENTRY_STORE_PATH)",
+    )
+    store_parent.add_argument("--runs", type=int, default=10, help="Only look at this many of the last runs")
+
+    slowest_fixtures = subparsers.add_parser(
+        "slowest-fixtures", parents=[store_parent], help="List the fixtures with the most setup time per run"
+    )
+    slowest_fixtures.add_argument("--limit", type=int, default=20)
+    slowest_fixtures.set_defaults(func=_slowest_fixtures)
+
+    flakiest = subparsers.add_parser(
+        "flakiest", parents=[store_parent], help="List the tests that most often needed reruns or changed outcome"
+    )
+    flakiest.add_argument("--limit", type=int, default=20)
+    flakiest.set_defaults(func=_flakiest)
+
+    trend = subparsers.add_parser(
+        "trend", parents=[store_parent], help="Show the outcome and phase durations of a test in the last runs"
+    )
+    trend.add_argument("nodeid")
+    trend.set_defaults(func=_trend)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,26 @@
+"""
+Put on `PYTHONPATH` by `pytest_sentry.propagation.propagate_to_subprocesses`,
+so that Python processes started by a test continue its trace.
+"""
+
+import importlib
+import os
+import sys
+
+if os.environ.get("PYTEST_SENTRY_TRACE"):
+    from pytest_sentry.propagation import bootstrap
+
+    bootstrap()
+
+# Load the `sitecustomize` module this one shadows, if there is one.
+_bootstrap_dir = os.path.dirname(os.path.abspath(__file__))
+_sys_path = sys.path
+sys.path = [path for path in sys.path if os.path.abspath(path or ".") != _bootstrap_dir]
+_module = sys.modules.pop(__name__)
+try:
+    importlib.import_module("sitecustomize")
+except ImportError:
+    pass
+finally:
+    sys.path = _sys_path
+    sys.modules[__name__] = _module
@@ -0,0 +1,98 @@
+import array
+import collections
+
+
+# How many of the slowest tests are listed in the summary.
+_SLOWEST_TESTS = 20
+
+# How many modules and fixtures with the highest total duration are listed in
+# the summary, so that its size does not grow with the testsuite.
+_TOP_ENTRIES = 50
+
+
+def _duration_stats(samples):
+    sorted_samples = sorted(samples)
+    count = len(sorted_samples)
+
+    def percentile(p):
+        return sorted_samples[min(count - 1, int(count * p / 100.0))]
+
+    return {
+        "count": count,
+        "sum": sum(sorted_samples),
+        "p50": percentile(50),
+        "p90": percentile(90),
+        "p99": percentile(99),
+        "max": sorted_samples[-1],
+    }
+
+
+class SessionAggregate(object):
+    """
+    Outcome counts and durations of all tests of a session that report to
+    the same client, for `aggregate_only` mode.
+
+    Durations are kept in one array of doubles per module and fixture
+    instead of one span per test.
+    """
+
+    def __init__(self):
+        self.outcomes = collections.defaultdict(collections.Counter)
+        self.module_durations = collections.defaultdict(lambda: array.array("d"))
+        self.fixture_durations = collections.defaultdict(lambda: array.array("d"))
+        self.test_durations = array.array("d")
+        self.slowest_tests = []
+
+    def add_outcome(self, module, outcome):
+        self.outcomes[module][outcome] += 1
+
+    def add_test(self, module, nodeid, duration):
+        self.test_durations.append(duration)
+        self.module_durations[module].append(duration)
+
+        if len(self.slowest_tests) < _SLOWEST_TESTS or duration > self.slowest_tests[-1][0]:
+            self.slowest_tests.append((duration, nodeid))
+            self.slowest_tests.sort(reverse=True)
+            del self.slowest_tests[_SLOWEST_TESTS:]
+
+    def add_fixture(self, argname, duration):
+        self.fixture_durations[argname].append(duration)
+
+    def totals(self):
+        """
+        Returns the number of tests per outcome in all modules.
+        """
+        totals = collections.Counter()
+        for outcomes in self.outcomes.values():
+            totals.update(outcomes)
+        return totals
+
+    def summary(self):
+        """
+        Returns the summary of the session, with the outcomes and durations of
+        the `_TOP_ENTRIES` modules and fixtures with the highest total
+        duration. `module_count` and `fixture_count` are the numbers of all
+        modules and fixtures.
+        """
+        # Every module with durations has outcomes, but modules where all
+        # tests were skipped have no durations.
+        modules = sorted(
+            self.outcomes, key=lambda module: sum(self.module_durations.get(module, ())), reverse=True
+        )[:_TOP_ENTRIES]
+        fixtures = sorted(self.fixture_durations, key=lambda argname: sum(self.fixture_durations[argname]), reverse=True)
+
+        return {
+            "outcomes": {module: dict(self.outcomes[module]) for module in modules},
+            "tests": _duration_stats(self.test_durations) if self.test_durations else None,
+            "slowest_tests": [{"nodeid": nodeid, "duration": duration} for duration, nodeid in self.slowest_tests],
+            "modules": {
+                module: _duration_stats(self.module_durations[module])
+                for module in modules
+                if module in self.module_durations
+            },
+            "module_count": len(self.outcomes),
+            "fixtures": {
+                argname: _duration_stats(self.fixture_durations[argname]) for argname in fixtures[:_TOP_ENTRIES]
+            },
+            "fixture_count": len(fixtures),
+        }
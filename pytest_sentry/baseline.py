@@ -0,0 +1,224 @@
+import array
+import json
+import sqlite3
+import statistics
+
+
+# Number of past durations kept per test and phase.
+_WINDOW = 20
+
+# Number of past durations needed before a test can be flagged as regressed.
+_MIN_SAMPLES = 5
+
+
+def _percentile(sorted_samples, percentile):
+    index = int(round((len(sorted_samples) - 1) * percentile / 100.0))
+    return sorted_samples[index]
+
+
+class DurationBaseline(object):
+    """
+    A local store of the last durations of each test's setup and call phase,
+    kept in a SQLite file as one compact array of doubles per test and phase.
+    """
+
+    def __init__(self, path, window=_WINDOW):
+        self.path = path
+        self.window = window
+        self._samples = None
+        self._new = []
+
+    def _connect(self):
+        # pytest-xdist workers share the file, so wait for each other's writes.
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS durations ("
+            " nodeid TEXT NOT NULL,"
+            " phase TEXT NOT NULL,"
+            " samples BLOB NOT NULL,"
+            " PRIMARY KEY (nodeid, phase))"
+        )
+        return conn
+
+    def load(self):
+        """
+        Returns the past durations as a dict of (nodeid, phase) to arrays.
+        """
+        if self._samples is None:
+            conn = self._connect()
+            try:
+                self._samples = {}
+                for nodeid, phase, blob in conn.execute("SELECT nodeid, phase, samples FROM durations"):
+                    samples = array.array("d")
+                    samples.frombytes(blob)
+                    self._samples[nodeid, phase] = samples
+            finally:
+                conn.close()
+
+        return self._samples
+
+    def stats(self, nodeid, phase):
+        """
+        Returns the (median, p95) of the past durations, or `None` if there
+        are too few of them.
+        """
+        samples = self.load().get((nodeid, phase))
+        if samples is None or len(samples) < _MIN_SAMPLES:
+            return None
+
+        sorted_samples = sorted(samples)
+        return statistics.median(sorted_samples), _percentile(sorted_samples, 95)
+
+    def slowest(self, phase, n):
+        """
+        Returns the nodeids of the `n` tests with the highest median duration
+        of `phase`.
+        """
+        medians = [
+            (statistics.median(samples), nodeid)
+            for (nodeid, samples_phase), samples in self.load().items()
+            if samples_phase == phase and samples
+        ]
+        medians.sort(reverse=True)
+        return [nodeid for _, nodeid in medians[:n]]
+
+    def record(self, nodeid, phase, duration, **extra):
+        """
+        Records a new duration. `extra` is passed on to the regressions
+        returned by `find_regressions`.
+        """
+        self._new.append(dict(extra, nodeid=nodeid, phase=phase, duration=duration))
+
+    def find_regressions(self, ratio, min_delta):
+        """
+        Returns the recorded durations that are more than `ratio` times the
+        median and above the p95 of the past durations, and at least
+        `min_delta` seconds slower than the median.
+        """
+        regressions = []
+        for entry in self._new:
+            stats = self.stats(entry["nodeid"], entry["phase"])
+            if stats is None:
+                continue
+
+            median, p95 = stats
+            duration = entry["duration"]
+            if duration > median * ratio and duration > p95 and duration - median >= min_delta:
+                regressions.append(dict(entry, median=median, p95=p95))
+
+        return regressions
+
+    def save(self):
+        """
+        Adds the recorded durations to the store.
+        """
+        if not self._new:
+            return
+
+        samples = self.load()
+        updated = {}
+        for entry in self._new:
+            key = entry["nodeid"], entry["phase"]
+            window = updated.get(key)
+            if window is None:
+                window = updated[key] = array.array("d", samples.get(key, ()))
+            window.append(entry["duration"])
+            del window[:-self.window]
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO durations (nodeid, phase, samples) VALUES (?, ?, ?)",
+                    [(nodeid, phase, window.tobytes()) for (nodeid, phase), window in updated.items()],
+                )
+        finally:
+            conn.close()
+
+        samples.update(updated)
+        self._new = []
+
+
+class BenchmarkBaseline(object):
+    """
+    A local store of the stats of every pytest-benchmark benchmark in its
+    last run, kept in the same SQLite file as `DurationBaseline`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._previous = None
+        self._new = []
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS benchmarks ("
+            " nodeid TEXT NOT NULL PRIMARY KEY,"
+            " stats TEXT NOT NULL)"
+        )
+        return conn
+
+    def load(self):
+        """
+        Returns the stats of the previous run as a dict of nodeid to dicts.
+        """
+        if self._previous is None:
+            conn = self._connect()
+            try:
+                self._previous = {
+                    nodeid: json.loads(stats) for nodeid, stats in conn.execute("SELECT nodeid, stats FROM benchmarks")
+                }
+            finally:
+                conn.close()
+
+        return self._previous
+
+    def record(self, nodeid, stats, **extra):
+        """
+        Records the stats of a benchmark. `extra` is passed on to the
+        regressions returned by `find_regressions`.
+        """
+        self._new.append(dict(extra, nodeid=nodeid, stats=stats))
+
+    def find_regressions(self, ratio):
+        """
+        Returns the recorded benchmarks whose median is more than `ratio`
+        times the median of the previous run.
+        """
+        regressions = []
+        previous = self.load()
+        for entry in self._new:
+            previous_stats = previous.get(entry["nodeid"])
+            if not previous_stats or not previous_stats["median"]:
+                continue
+
+            if entry["stats"]["median"] > previous_stats["median"] * ratio:
+                regressions.append(dict(
+                    entry,
+                    median=entry["stats"]["median"],
+                    previous_median=previous_stats["median"],
+                    previous_stats=previous_stats,
+                ))
+
+        return regressions
+
+    def save(self):
+        """
+        Replaces the stats of the previous run with the recorded ones.
+        """
+        if not self._new:
+            return
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO benchmarks (nodeid, stats) VALUES (?, ?)",
+                    [(entry["nodeid"], json.dumps(entry["stats"])) for entry in self._new],
+                )
+        finally:
+            conn.close()
+
+        self.load().update((entry["nodeid"], entry["stats"]) for entry in self._new)
+        self._new = []
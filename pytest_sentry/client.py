@@ -4,6 +4,10 @@ import sentry_sdk
 from .integration import PytestIntegration
 
 
+# Reasons with which transports record the items they failed to send.
+_TRANSPORT_LOSS_REASONS = frozenset(["queue_overflow", "network_error", "ratelimit_backoff"])
+
+
 class Client(sentry_sdk.Client):
     """
     A client that is used to report errors from tests.
@@ -30,13 +34,66 @@ class Client(sentry_sdk.Client):
             "auto_enabling_integrations",
             True,
         )
+        if os.environ.get("PYTEST_SENTRY_SPOOL_DIR"):
+            # Imported here, as most runs send envelopes right away.
+            from .spool import SpoolTransport
+
+            kwargs.setdefault("transport", SpoolTransport)
         kwargs.setdefault(
             "environment",
             os.environ.get("SENTRY_ENVIRONMENT", "test"),
         )
-        kwargs.setdefault("integrations", []).append(PytestIntegration())
+        integrations = kwargs["integrations"] = list(kwargs.get("integrations", ()))
+        if not any(isinstance(integration, PytestIntegration) for integration in integrations):
+            # Allow passing a configured `PytestIntegration` instead of the default one
+            integrations.append(PytestIntegration())
 
         debug = os.environ.get("PYTEST_SENTRY_DEBUG", "").lower() in ("1", "true", "yes")
         kwargs.setdefault("debug", debug)
 
+        # Number of events and transactions handed to the transport, and of
+        # envelopes the transport dropped, eg. because its queue was full, the
+        # request failed or was rate limited. Used to report how much was
+        # delivered at the end of the test session.
+        self.captured_count = 0
+        self.dropped_count = 0
+
         sentry_sdk.Client.__init__(self, *args, **kwargs)
+
+        if self.transport is not None:
+            self._count_dropped_envelopes(self.transport)
+
+    def _count_dropped_envelopes(self, transport):
+        # Transports record every item they lose. Items the client itself
+        # discards, eg. by sampling, are recorded as well, but never count as
+        # captured.
+        record_lost_event = transport.record_lost_event
+
+        def _record_lost_event(reason, data_category=None, item=None, **kwargs):
+            if reason in _TRANSPORT_LOSS_REASONS:
+                if item is not None:
+                    if item.type in ("event", "transaction"):
+                        self.dropped_count += 1
+                elif data_category in ("error", "transaction"):
+                    self.dropped_count += 1
+            return record_lost_event(reason, data_category=data_category, item=item, **kwargs)
+
+        transport.record_lost_event = _record_lost_event
+
+        # Envelopes rejected with a 429 response are not recorded as lost, as
+        # Sentry counts them itself.
+        on_dropped_event = getattr(transport, "on_dropped_event", None)
+        if on_dropped_event is not None:
+
+            def _on_dropped_event(reason):
+                if reason == "status_429":
+                    self.dropped_count += 1
+                return on_dropped_event(reason)
+
+            transport.on_dropped_event = _on_dropped_event
+
+    def capture_event(self, *args, **kwargs):
+        rv = sentry_sdk.Client.capture_event(self, *args, **kwargs)
+        if rv is not None:
+            self.captured_count += 1
+        return rv
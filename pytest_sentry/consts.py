@@ -1,3 +1,6 @@
+# Modules whose frames are not marked as in-app by default.
+_DEFAULT_IN_APP_EXCLUDE = ("_pytest", "pytest", "pluggy")
+
 _ENVVARS_AS_TAGS = frozenset(
     [
         "GITHUB_WORKFLOW",  # The name of the workflow.
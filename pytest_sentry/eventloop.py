@@ -0,0 +1,140 @@
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+
+
+# At most this many slow callbacks are reported as spans per test.
+_MAX_SLOW_CALLBACK_SPANS = 100
+
+# The monitor that propagated into a context, so that copies of the context
+# are not propagated into again.
+_propagated_by = contextvars.ContextVar("pytest_sentry_propagated_by", default=None)
+
+_original_call_soon = None
+_original_call_at = None
+
+
+def _describe(callback):
+    # The steps of a task are methods of the task, whose repr names the
+    # coroutine it runs.
+    task = getattr(callback, "__self__", None)
+    if isinstance(task, asyncio.Task):
+        return repr(task)
+    return getattr(callback, "__qualname__", None) or repr(callback)
+
+
+class EventLoopMonitor(object):
+    """
+    Times the callbacks that are scheduled on asyncio event loops in the
+    calling thread between `start` and `stop`, eg. the steps of the tasks of
+    an async test run by pytest-asyncio or anyio.
+
+    Callbacks that take at least `slow_callback_duration` seconds block the
+    loop, and are kept with their description. The lag of timer callbacks,
+    ie. how late they ran because the loop was busy, is tracked as well.
+
+    `propagate` is called once in every context callbacks run in, and its
+    return value is passed to `restore` in that context on `stop`. Event loop
+    runners like `asyncio.Runner` run tasks in a context they copied when
+    they were created, so this is how the context of the test gets into them,
+    and out of them again before the next test.
+    """
+
+    def __init__(self, slow_callback_duration, propagate=None, restore=None):
+        self.slow_callback_duration = slow_callback_duration
+        self.propagate = propagate
+        self.restore = restore
+        self.callbacks = 0
+        self.busy = 0.0
+        self.max_lag = 0.0
+        self.slow_callbacks = []
+        self._thread_id = None
+        self._propagated = []
+
+    def _wrap(self, loop, when, callback, context):
+        if context is None:
+            # What the handle does as well, but the context is needed to
+            # restore it on `stop`.
+            context = contextvars.copy_context()
+        return functools.partial(self._run_callback, loop, when, callback, context), context
+
+    def _call_soon(self, loop, callback, *args, context=None):
+        if threading.get_ident() == self._thread_id:
+            callback, context = self._wrap(loop, None, callback, context)
+        return _original_call_soon(loop, callback, *args, context=context)
+
+    def _call_at(self, loop, when, callback, *args, context=None):
+        if threading.get_ident() == self._thread_id:
+            callback, context = self._wrap(loop, when, callback, context)
+        return _original_call_at(loop, when, callback, *args, context=context)
+
+    def _run_callback(self, loop, when, callback, context, *args):
+        # Callbacks scheduled during the test may still run after `stop`.
+        if self.propagate is not None and self._thread_id is not None and _propagated_by.get() is not self:
+            self._propagated.append((context, self.propagate(), _propagated_by.set(self)))
+
+        if when is not None:
+            self.max_lag = max(self.max_lag, loop.time() - when)
+
+        start = time.perf_counter()
+        try:
+            return callback(*args)
+        finally:
+            duration = time.perf_counter() - start
+            self.callbacks += 1
+            self.busy += duration
+            if duration >= self.slow_callback_duration:
+                self.slow_callbacks.append((time.time() - duration, duration, _describe(callback)))
+
+    def _restore(self, token, propagated_by_token):
+        if self.restore is not None:
+            self.restore(token)
+        _propagated_by.reset(propagated_by_token)
+
+    def start(self):
+        global _original_call_soon, _original_call_at
+
+        if _original_call_soon is not None:
+            raise RuntimeError("Another EventLoopMonitor is already running")
+
+        self._thread_id = threading.get_ident()
+        _original_call_soon = asyncio.BaseEventLoop.call_soon
+        _original_call_at = asyncio.BaseEventLoop.call_at
+        asyncio.BaseEventLoop.call_soon = lambda loop, *args, **kwargs: self._call_soon(loop, *args, **kwargs)
+        asyncio.BaseEventLoop.call_at = lambda loop, *args, **kwargs: self._call_at(loop, *args, **kwargs)
+
+    def stop(self):
+        global _original_call_soon, _original_call_at
+
+        asyncio.BaseEventLoop.call_soon = _original_call_soon
+        asyncio.BaseEventLoop.call_at = _original_call_at
+        _original_call_soon = None
+        _original_call_at = None
+        self._thread_id = None
+
+        for context, token, propagated_by_token in reversed(self._propagated):
+            context.run(self._restore, token, propagated_by_token)
+        self._propagated = []
+
+    def report(self, span):
+        """
+        Sets the measurements as attributes of `span`, and adds an
+        `asyncio.callback` child span for every slow callback.
+        """
+        span.set_attribute("pytest-sentry.asyncio.callbacks", self.callbacks)
+        span.set_attribute("pytest-sentry.asyncio.busy", self.busy)
+        span.set_attribute("pytest-sentry.asyncio.max_lag", self.max_lag)
+        span.set_attribute("pytest-sentry.asyncio.slow_callbacks", len(self.slow_callbacks))
+
+        for start_timestamp, duration, description in self.slow_callbacks[:_MAX_SLOW_CALLBACK_SPANS]:
+            child = span.start_child(op="asyncio.callback", name=description, start_timestamp=start_timestamp)
+            child.finish(end_timestamp=start_timestamp + duration)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
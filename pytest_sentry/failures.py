@@ -0,0 +1,74 @@
+import os
+
+
+# How many nodeids are listed in an aggregated failure event.
+_MAX_LISTED_NODEIDS = 100
+
+
+def failure_fingerprint(exc_info, integration):
+    """
+    Returns a fingerprint of a failure: the exception type and the innermost
+    in-app frame of the traceback.
+    """
+    exc_type, _, tb = exc_info
+    location = None
+    while tb is not None:
+        frame = tb.tb_frame
+        if integration._is_in_app(frame.f_globals.get("__name__"), frame.f_code.co_filename):
+            location = (os.path.relpath(frame.f_code.co_filename), tb.tb_lineno, frame.f_code.co_name)
+        tb = tb.tb_next
+
+    return ("{}.{}".format(exc_type.__module__, exc_type.__qualname__),) + (location or (None, None, None))
+
+
+class FailureGroup(object):
+    """
+    The tests of a session that failed with the same fingerprint.
+    """
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.count = 0
+        self.reported = 0
+        self.nodeids = []
+
+    def add(self, nodeid, max_events):
+        """
+        Counts a failure of `nodeid`, and returns whether it should still be
+        reported as its own event.
+        """
+        self.count += 1
+        if len(self.nodeids) < _MAX_LISTED_NODEIDS and nodeid not in self.nodeids:
+            self.nodeids.append(nodeid)
+
+        if self.reported < max_events:
+            self.reported += 1
+            return True
+        return False
+
+    def to_event(self):
+        """
+        Returns an event summarizing the failures that were not reported
+        individually.
+        """
+        exc_type, filename, lineno, function = self.fingerprint
+        location = None
+        message = "{} failed {} tests".format(exc_type, self.count)
+        if filename is not None:
+            location = "{}:{} in {}".format(filename, lineno, function)
+            message += " at " + location
+
+        return {
+            "level": "error",
+            "message": "{} ({} reported individually)".format(message, self.reported),
+            "fingerprint": ["pytest-sentry-failures"] + [str(part) for part in self.fingerprint],
+            "contexts": {
+                "pytest_sentry.failures": {
+                    "exception_type": exc_type,
+                    "location": location,
+                    "count": self.count,
+                    "reported": self.reported,
+                    "nodeids": self.nodeids,
+                },
+            },
+        }
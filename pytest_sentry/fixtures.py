@@ -1,6 +1,6 @@
 import pytest
 
-from .helpers import _resolve_scope_marker_value
+from .helpers import _resolve_item_scope
 
 
 @pytest.fixture
@@ -9,5 +9,4 @@ def sentry_test_scope(request):
     Gives back the isolation Scope.
     """
 
-    item = request.node
-    return _resolve_scope_marker_value(item.get_closest_marker("sentry_client"))
+    return _resolve_item_scope(request.node)
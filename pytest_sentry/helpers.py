@@ -1,25 +1,204 @@
+import collections
+import json
+import os
+import time
+import weakref
+
+import pytest
 import sentry_sdk
 from sentry_sdk.scope import ScopeType
-from sentry_sdk.opentelemetry.scope import setup_scope_context_management
 
 from pytest_sentry.client import Client
 
 
-setup_scope_context_management()
-DEFAULT_ISOLATION_SCOPE = sentry_sdk.Scope(ty=ScopeType.ISOLATION)
-DEFAULT_ISOLATION_SCOPE.set_client(Client())
+# The default client is only created once a hook actually needs a reporting
+# scope, so that importing the plugin stays cheap and runs without a DSN never
+# pay for client and integration setup.
+_default_isolation_scope = None
+_scope_context_management_set_up = False
 
-_isolation_scope_cache = {}
 
+def _setup_scope_context_management():
+    global _scope_context_management_set_up
 
-def _resolve_scope_marker_value(marker_value):
-    if id(marker_value) not in _isolation_scope_cache:
-        _isolation_scope_cache[id(marker_value)] = rv = _resolve_scope_marker_value_uncached(
-            marker_value
+    if not _scope_context_management_set_up:
+        from sentry_sdk.opentelemetry.scope import setup_scope_context_management
+
+        setup_scope_context_management()
+        _scope_context_management_set_up = True
+
+
+def _get_default_isolation_scope():
+    global _default_isolation_scope
+
+    if _default_isolation_scope is None:
+        _setup_scope_context_management()
+        scope = sentry_sdk.Scope(ty=ScopeType.ISOLATION)
+        scope.set_client(Client())
+        _default_isolation_scope = scope
+
+    return _default_isolation_scope
+
+
+def __getattr__(name):
+    # Backwards compatibility for code that imported the eagerly created scope.
+    if name == "DEFAULT_ISOLATION_SCOPE":
+        return _get_default_isolation_scope()
+
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+# Resolved scopes are cached per marker object. Entries keep a strong
+# reference to the marker so that its id() cannot be reused by another object
+# while the entry is alive. Least recently used entries are evicted once the
+# cache grows beyond `_ISOLATION_SCOPE_CACHE_MAXSIZE`.
+_ISOLATION_SCOPE_CACHE_MAXSIZE = 1024
+_isolation_scope_cache = collections.OrderedDict()
+
+_item_isolation_scope_key = pytest.StashKey()
+
+# Clients created for DSN string and dict markers, shared by all markers with
+# the same options, so that every configuration only has one transport with
+# its worker thread and connection pool. Maps the normalized options to a
+# [client, refcount] pair, counting the cached markers using the client.
+# Clients no marker uses anymore are kept in `_released_clients` until they
+# are closed at the end of the session, as tests may still hold on to them.
+_client_pool = {}
+_released_clients = []
+
+# All clients that tests reported to, flushed at the end of the session.
+_reporting_clients = weakref.WeakSet()
+
+# Propagation headers of the trace that all tests of a session belong to. Only
+# set when running with pytest-xdist, where the controller creates the trace
+# and passes it on to the workers.
+_session_trace_headers_key = pytest.StashKey()
+
+# Start of the session, and the span trees of `hierarchical_spans` per
+# isolation scope and the test span of the item that is running.
+_session_start_key = pytest.StashKey()
+_span_trees_key = pytest.StashKey()
+_item_test_span_key = pytest.StashKey()
+
+
+def _new_trace_headers():
+    scope = sentry_sdk.Scope()
+    scope.set_new_propagation_context()
+    return dict(scope.iter_headers())
+
+
+def _get_xdist_worker_id(config):
+    workerinput = getattr(config, "workerinput", None)
+    if workerinput is None:
+        return None
+    return workerinput.get("workerid")
+
+
+def _pending_envelopes(client):
+    # Only the default HTTP transports queue envelopes in a background worker.
+    worker = getattr(client.transport, "_worker", None)
+    queue = getattr(worker, "_queue", None)
+    return queue.qsize() if queue is not None else 0
+
+
+def _flush_clients(timeout):
+    """
+    Flushes all clients tests reported to, within a total time budget of
+    `timeout` seconds. Envelopes the transports dropped, and those still
+    queued when the budget is used up, are counted as dropped.
+    """
+    stats = {"clients": 0, "captured": 0, "dropped": 0, "duration": 0.0}
+    start = time.monotonic()
+    deadline = start + timeout
+
+    for client in list(_reporting_clients):
+        if not client.is_active():
+            continue
+
+        stats["clients"] += 1
+        stats["captured"] += getattr(client, "captured_count", 0)
+        client.flush(timeout=max(deadline - time.monotonic(), 0), callback=lambda pending, timeout: None)
+        stats["dropped"] += getattr(client, "dropped_count", 0) + _pending_envelopes(client)
+
+    stats["duration"] = time.monotonic() - start
+    return stats
+
+
+def _client_pool_key(options):
+    # Options that are not JSON, like integrations or callbacks, are compared
+    # by identity through their repr.
+    return json.dumps(options, sort_keys=True, default=repr)
+
+
+def _acquire_pooled_client(options):
+    key = _client_pool_key(options)
+    entry = _client_pool.get(key)
+    if entry is None:
+        entry = _client_pool[key] = [Client(**options), 0]
+    entry[1] += 1
+    return entry[0]
+
+
+def _release_pooled_client(client):
+    for key, entry in _client_pool.items():
+        if entry[0] is client:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del _client_pool[key]
+                _released_clients.append(client)
+            return
+
+
+def _close_pooled_clients():
+    """
+    Closes all pooled clients, and forgets the scopes using them. Call after
+    `_flush_clients`, as anything still queued is dropped.
+    """
+    clients = [entry[0] for entry in _client_pool.values()] + _released_clients
+    _client_pool.clear()
+    del _released_clients[:]
+
+    for client in clients:
+        client.close(timeout=0)
+
+    for key, (marker, scope) in list(_isolation_scope_cache.items()):
+        if any(scope.client is client for client in clients):
+            del _isolation_scope_cache[key]
+
+    return len(clients)
+
+
+def _resolve_item_scope(item):
+    """
+    Returns the isolation scope for a test item. The scope is resolved once
+    and stored on the item itself, so it goes away together with the item.
+    """
+    try:
+        return item.stash[_item_isolation_scope_key]
+    except KeyError:
+        rv = item.stash[_item_isolation_scope_key] = _resolve_scope_marker_value(
+            item.get_closest_marker("sentry_client")
         )
         return rv
 
-    return _isolation_scope_cache[id(marker_value)]
+
+def _resolve_scope_marker_value(marker_value):
+    key = id(marker_value)
+    entry = _isolation_scope_cache.get(key)
+    if entry is not None and entry[0] is marker_value:
+        _isolation_scope_cache.move_to_end(key)
+        return entry[1]
+
+    rv = _resolve_scope_marker_value_uncached(marker_value)
+    if rv.client.is_active():
+        _reporting_clients.add(rv.client)
+
+    _isolation_scope_cache[key] = (marker_value, rv)
+    while len(_isolation_scope_cache) > _ISOLATION_SCOPE_CACHE_MAXSIZE:
+        _, (_, evicted) = _isolation_scope_cache.popitem(last=False)
+        _release_pooled_client(evicted.client)
+
+    return rv
 
 
 def _resolve_scope_marker_value_uncached(marker_value):
@@ -27,10 +206,18 @@ def _resolve_scope_marker_value_uncached(marker_value):
         # If no special configuration is provided
         # (like pytestmark or @pytest.mark.sentry_client() decorator)
         # use the default scope
-        marker_value = DEFAULT_ISOLATION_SCOPE
+        if not (os.environ.get("PYTEST_SENTRY_DSN") or os.environ.get("SENTRY_DSN")):
+            # Without a DSN nothing would be sent anyway, so skip setting up
+            # the client and disable the plugin hooks entirely. The client
+            # falls back to `SENTRY_DSN` like any other Sentry client.
+            return sentry_sdk.Scope()
+
+        marker_value = _get_default_isolation_scope()
     else:
         marker_value = marker_value.args[0]
 
+    _setup_scope_context_management()
+
     if callable(marker_value):
         # If a callable is provided, call it to get the real marker value
         marker_value = marker_value()
@@ -40,15 +227,15 @@ def _resolve_scope_marker_value_uncached(marker_value):
         return sentry_sdk.Scope()
 
     if isinstance(marker_value, str):
-        # If a DSN string is provided, create a new client and use that
+        # If a DSN string is provided, use a client for that DSN
         scope = sentry_sdk.Scope(ty=ScopeType.ISOLATION)
-        scope.set_client(Client(marker_value))
+        scope.set_client(_acquire_pooled_client({"dsn": marker_value.strip()}))
         return scope
 
     if isinstance(marker_value, dict):
-        # If a dict is provided, create a new client using the dict as Client options
+        # If a dict is provided, use a client with the dict as Client options
         scope = sentry_sdk.Scope(ty=ScopeType.ISOLATION)
-        scope.set_client(Client(**marker_value))
+        scope.set_client(_acquire_pooled_client(marker_value))
         return scope
 
     if isinstance(marker_value, Client):
@@ -1,63 +1,900 @@
+import contextlib
+import functools
+import os
+import random
+import time
+
 import pytest
-import wrapt
+from opentelemetry import context as otel_context
 
 import sentry_sdk
 
-from .helpers import _resolve_scope_marker_value
-from .integration import PytestIntegration
+from .helpers import (
+    _close_pooled_clients,
+    _flush_clients,
+    _get_xdist_worker_id,
+    _item_test_span_key,
+    _new_trace_headers,
+    _resolve_item_scope,
+    _resolve_scope_marker_value,
+    _session_start_key,
+    _session_trace_headers_key,
+    _setup_scope_context_management,
+    _span_trees_key,
+)
+from .integration import PytestIntegration, get_environ_tags
+
+
+_flush_stats_key = pytest.StashKey()
+_baseline_path_key = pytest.StashKey()
+_baseline_key = pytest.StashKey()
+_regressions_key = pytest.StashKey()
+_item_trace_context_key = pytest.StashKey()
+_hotspots_key = pytest.StashKey()
+_hotspot_totals_key = pytest.StashKey()
+_item_profile_key = pytest.StashKey()
+_item_resource_collectors_key = pytest.StashKey()
+_resource_usage_key = pytest.StashKey()
+_failure_groups_key = pytest.StashKey()
+_item_counted_failures_key = pytest.StashKey()
+_initial_conftests_timing_key = pytest.StashKey()
+_collection_span_key = pytest.StashKey()
+_collect_durations_key = pytest.StashKey()
+_collection_report_key = pytest.StashKey()
+_item_call_span_key = pytest.StashKey()
+_aggregates_key = pytest.StashKey()
+_benchmark_baseline_key = pytest.StashKey()
+_benchmark_regressions_key = pytest.StashKey()
+
+# Number of slowest modules to collect listed if
+# `PYTEST_SENTRY_COLLECTION_REPORT_TOP` is not set.
+_DEFAULT_COLLECTION_REPORT_TOP = 10
+
+# Stats of pytest-benchmark's `benchmark` fixture sent as span attributes.
+_BENCHMARK_STATS = ("min", "max", "mean", "median", "stddev", "iqr", "rounds", "ops")
 
 
+@pytest.hookimpl(wrapper=True)
 def pytest_load_initial_conftests(early_config, parser, args):
     """
     Pytest hook that is called when pytest starts.
     See https://docs.pytest.org/en/stable/reference/reference.html#pytest.hookspec.pytest_load_initial_conftests
     """
+    # This has to happen before conftests and test modules are imported, as
+    # they may already hold on to the current scopes.
+    _setup_scope_context_management()
+
     early_config.addinivalue_line(
         "markers",
         "sentry_client(client=None): Use this client instance for reporting tests. You can also pass a DSN string directly, or a `Scope` if you need it.",
     )
+    early_config.addinivalue_line(
+        "markers",
+        "sentry_profile: Sample the stack of this test and include it in the pytest-sentry hotspot report.",
+    )
+    early_config.addinivalue_line(
+        "markers",
+        "sentry_resources(*collectors): Also report these expensive resource measurements (tracemalloc, fds) on this test's spans. Defaults to all of them.",
+    )
 
+    start_timestamp = time.time()
+    try:
+        return (yield)
+    finally:
+        early_config.stash[_initial_conftests_timing_key] = (start_timestamp, time.time())
 
-def hookwrapper(itemgetter, **kwargs):
+
+def pytest_addoption(parser):
     """
-    A version of pytest.hookimpl that sets the current scope to the correct one
-    and skips the hook if the integration is disabled.
+    Pytest hook that registers command line options.
+    See https://docs.pytest.org/en/stable/reference/reference.html#pytest.hookspec.pytest_addoption
+    """
+    group = parser.getgroup("sentry")
+    group.addoption(
+        "--sentry-durations",
+        default=os.environ.get("PYTEST_SENTRY_DURATIONS_PATH"),
+        metavar="PATH",
+        help="Record the durations of tests and shared fixtures in this JSON file, and read them for --sentry-shard.",
+    )
+    group.addoption(
+        "--sentry-shard",
+        default=None,
+        metavar="K/N",
+        help="Only run the K-th of N shards of the collected tests, balanced by the durations in --sentry-durations.",
+    )
+    group.addoption(
+        "--sentry-store",
+        default=os.environ.get("PYTEST_SENTRY_STORE_PATH"),
+        metavar="PATH",
+        help="Record the results of all tests and fixtures in this SQLite file, see `python -m pytest_sentry --help`.",
+    )
+
+
+def _parse_collection_report(enabled, top):
+    """
+    Returns how many of the slowest modules to collect to list in the
+    terminal summary for the values of `PYTEST_SENTRY_COLLECTION_REPORT` and
+    `PYTEST_SENTRY_COLLECTION_REPORT_TOP`, or 0 if the report is disabled.
+    """
+    if (enabled or "").strip().lower() not in ("1", "true", "yes"):
+        return 0
+    if not top:
+        return _DEFAULT_COLLECTION_REPORT_TOP
+    return max(int(top), 0)
+
+
+def pytest_configure(config):
+    """
+    Pytest hook that is called after command line options have been parsed.
+    See https://docs.pytest.org/en/stable/reference/reference.html#pytest.hookspec.pytest_configure
+    """
+    config.stash[_collection_report_key] = _parse_collection_report(
+        os.environ.get("PYTEST_SENTRY_COLLECTION_REPORT"),
+        os.environ.get("PYTEST_SENTRY_COLLECTION_REPORT_TOP"),
+    )
+    # Read once, as the baseline is looked up in every test phase.
+    config.stash[_baseline_path_key] = os.environ.get("PYTEST_SENTRY_BASELINE_PATH") or None
+
+    durations_path = config.getoption("sentry_durations")
+    shard_option = config.getoption("sentry_shard")
+    if durations_path or shard_option:
+        from .sharding import ShardingPlugin, parse_shard
+
+        shard, shards = parse_shard(shard_option) if shard_option else (None, None)
+        config.pluginmanager.register(
+            ShardingPlugin(config, durations_path, shard, shards), "pytest-sentry-sharding"
+        )
+
+    store_path = config.getoption("sentry_store")
+    if store_path:
+        # Imported here, as `sqlite3` is only needed with a run store.
+        from .runstore import RunStorePlugin
 
-    Assumes the function is a hookwrapper, ie yields once
+        config.pluginmanager.register(RunStorePlugin(config, store_path), "pytest-sentry-store")
+
+    workerinput = getattr(config, "workerinput", None)
+    if workerinput is not None:
+        # pytest-xdist worker: continue the trace of the controller
+        headers = workerinput.get("pytest_sentry_trace")
+        if headers:
+            config.stash[_session_trace_headers_key] = headers
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_configure_node(node):
+    """
+    pytest-xdist hook that is called on the controller when a worker node is
+    set up. Passes the session trace to the worker.
     """
+    config = node.config
+    if _session_trace_headers_key not in config.stash:
+        config.stash[_session_trace_headers_key] = _new_trace_headers()
 
-    @wrapt.decorator
-    def _with_isolation_scope(wrapped, instance, args, kwargs):
-        item = itemgetter(*args, **kwargs)
-        isolation_scope = _resolve_scope_marker_value(item.get_closest_marker("sentry_client"))
+    node.workerinput["pytest_sentry_trace"] = config.stash[_session_trace_headers_key]
 
-        if isolation_scope.client.get_integration(PytestIntegration) is None:
-            yield
+
+def pytest_sessionstart(session):
+    """
+    Pytest hook that is called after the Session object has been created.
+    See https://docs.pytest.org/en/stable/reference/reference.html#pytest.hookspec.pytest_sessionstart
+    """
+    session.config.stash[_session_start_key] = time.time()
+    get_environ_tags(refresh=True)
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_collection(session):
+    """
+    Pytest hook that is called to collect the tests of the session. Reported
+    as a `pytest.collection` transaction, which also covers the loading of
+    the initial conftests.
+    See https://docs.pytest.org/en/stable/reference/reference.html#pytest.hookspec.pytest_collection
+    """
+    config = session.config
+    if config.pluginmanager.has_plugin("dsession"):
+        # The controller of pytest-xdist does not collect tests itself, the
+        # workers report their collection.
+        return (yield)
+
+    # Markers are only known once tests are collected, so collection is
+    # reported to the default client.
+    isolation_scope = _resolve_scope_marker_value(None)
+    integration = isolation_scope.client.get_integration(PytestIntegration)
+    if integration is None and not config.stash[_collection_report_key]:
+        return (yield)
+
+    config.stash[_collect_durations_key] = []
+    if integration is None:
+        return (yield)
+
+    conftests_timing = config.stash.get(_initial_conftests_timing_key, None)
+    start_timestamp = conftests_timing[0] if conftests_timing is not None else time.time()
+    headers = config.stash.get(_session_trace_headers_key, None)
+
+    with sentry_sdk.use_isolation_scope(isolation_scope):
+        if integration.hierarchical_spans and not integration.aggregate_only:
+            from .spans import get_span_tree
+
+            span = get_span_tree(config, isolation_scope, headers).session_span.start_child(
+                op="pytest.collection", name="pytest.collection", start_timestamp=start_timestamp
+            )
         else:
+            with sentry_sdk.continue_trace(headers or {}):
+                span = sentry_sdk.start_span(
+                    op="pytest.collection", name="pytest.collection", start_timestamp=start_timestamp
+                )
+
+        if conftests_timing is not None:
+            conftests_span = span.start_child(
+                op="pytest.load_initial_conftests",
+                name="pytest.load_initial_conftests",
+                start_timestamp=conftests_timing[0],
+            )
+            conftests_span.finish(end_timestamp=conftests_timing[1])
+
+    config.stash[_collection_span_key] = isolation_scope, span
+    try:
+        return (yield)
+    finally:
+        del config.stash[_collection_span_key]
+        with sentry_sdk.use_isolation_scope(isolation_scope):
+            span.set_attribute("pytest-sentry.collected", len(session.items))
+            span.finish()
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_make_collect_report(collector):
+    """
+    Pytest hook that is called to collect the children of a collector. For
+    modules this includes importing them, for directories loading their
+    conftest. Reported as `pytest.collect.module` and
+    `pytest.collect.directory` spans below the `pytest.collection`
+    transaction.
+    See https://docs.pytest.org/en/stable/reference/reference.html#pytest.hookspec.pytest_make_collect_report
+    """
+    durations = collector.config.stash.get(_collect_durations_key, None)
+    if durations is None:
+        return (yield)
+
+    if isinstance(collector, pytest.File):
+        op = "pytest.collect.module"
+    elif isinstance(collector, pytest.Directory):
+        op = "pytest.collect.directory"
+    else:
+        return (yield)
+
+    start_timestamp = time.time()
+    report = yield
+    end_timestamp = time.time()
+
+    if op == "pytest.collect.module":
+        durations.append((collector.nodeid, end_timestamp - start_timestamp))
+
+    collection = collector.config.stash.get(_collection_span_key, None)
+    if collection is not None:
+        isolation_scope, parent_span = collection
+        with sentry_sdk.use_isolation_scope(isolation_scope):
+            span = parent_span.start_child(op=op, name=collector.nodeid, start_timestamp=start_timestamp)
+            span.set_attribute("pytest-sentry.collect.outcome", report.outcome)
+            span.finish(end_timestamp=end_timestamp)
+
+    return report
+
+
+def pytest_collection_finish(session):
+    """
+    Pytest hook that is called after collection has been performed.
+    Resolves which tests are profiled, and which have the `sentry_resources`
+    marker, once instead of in every test phase and fixture setup.
+    See https://docs.pytest.org/en/stable/reference/reference.html#pytest.hookspec.pytest_collection_finish
+    """
+    config = session.config
+    slowest = int(os.environ.get("PYTEST_SENTRY_PROFILE_SLOWEST", 0))
+    baseline = _get_baseline(config) if slowest else None
+    profile_slowest = frozenset(baseline.slowest("call", slowest)) if baseline is not None else frozenset()
+
+    for item in session.items:
+        if item.get_closest_marker("sentry_profile") is not None or item.nodeid in profile_slowest:
+            item.stash[_item_profile_key] = True
+
+        marker = item.get_closest_marker("sentry_resources")
+        if marker is not None:
+            from .resources import EXPENSIVE_COLLECTORS
+
+            item.stash[_item_resource_collectors_key] = frozenset(marker.args or EXPENSIVE_COLLECTORS)
+
+
+def pytest_sessionfinish(session):
+    """
+    Pytest hook that is called after the whole test run finished.
+    See https://docs.pytest.org/en/stable/reference/reference.html#pytest.hookspec.pytest_sessionfinish
+    """
+    _report_failure_groups(session.config)
+    _report_aggregates(session.config)
+    hotspots = _report_hotspots(session.config)
+    if session.config.stash.get(_span_trees_key, None):
+        from .spans import finish_span_trees
+
+        finish_span_trees(session.config)
+    regressions = _report_regressions(session.config)
+    benchmark_regressions = _report_benchmark_regressions(session.config)
+
+    # Don't rely on the SDK's atexit handling, which can block for several
+    # seconds per client if the ingest endpoint is slow.
+    timeout = float(os.environ.get("PYTEST_SENTRY_FLUSH_TIMEOUT", 2.0))
+    stats = _flush_clients(timeout)
+    stats["timeout"] = timeout
+    _close_pooled_clients()
+    session.config.stash.setdefault(_flush_stats_key, []).append(stats)
+
+    workeroutput = getattr(session.config, "workeroutput", None)
+    if workeroutput is not None:
+        workeroutput["pytest_sentry_flush"] = stats
+        workeroutput["pytest_sentry_regressions"] = regressions
+        workeroutput["pytest_sentry_benchmark_regressions"] = benchmark_regressions
+        workeroutput["pytest_sentry_hotspots"] = hotspots.to_dict() if hotspots is not None else None
+        workeroutput["pytest_sentry_collect_durations"] = session.config.stash.get(_collect_durations_key, [])
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    """
+    pytest-xdist hook that is called on the controller when a worker node
+    finished. Collects the flush statistics, slow test and benchmark
+    regressions, profiling hotspots and collection durations of the worker.
+    """
+    workeroutput = getattr(node, "workeroutput", {})
+    stats = workeroutput.get("pytest_sentry_flush")
+    if stats is not None:
+        node.config.stash.setdefault(_flush_stats_key, []).append(stats)
+
+    node.config.stash.setdefault(_regressions_key, []).extend(
+        workeroutput.get("pytest_sentry_regressions", ())
+    )
+    node.config.stash.setdefault(_benchmark_regressions_key, []).extend(
+        workeroutput.get("pytest_sentry_benchmark_regressions", ())
+    )
+
+    # Every worker collects all tests, so the durations are merged.
+    durations = workeroutput.get("pytest_sentry_collect_durations")
+    if durations:
+        node.config.stash.setdefault(_collect_durations_key, []).extend(durations)
+
+    hotspots = workeroutput.get("pytest_sentry_hotspots")
+    if hotspots is not None:
+        from .profiling import Hotspots
+
+        node.config.stash.setdefault(_hotspot_totals_key, Hotspots()).update(Hotspots.from_dict(hotspots))
+
+
+def pytest_terminal_summary(terminalreporter):
+    """
+    Pytest hook that adds a section to the terminal summary.
+    See https://docs.pytest.org/en/stable/reference/reference.html#pytest.hookspec.pytest_terminal_summary
+    """
+    top = terminalreporter.config.stash.get(_collection_report_key, 0)
+    durations = terminalreporter.config.stash.get(_collect_durations_key, None)
+    if top and durations:
+        slowest = {}
+        for nodeid, duration in durations:
+            slowest[nodeid] = max(duration, slowest.get(nodeid, 0.0))
+
+        terminalreporter.write_line("pytest-sentry: slowest modules to collect")
+        for nodeid, duration in sorted(slowest.items(), key=lambda entry: entry[1], reverse=True)[:top]:
+            terminalreporter.write_line("  {:8.3f}s  {}".format(duration, nodeid))
+
+    regressions = terminalreporter.config.stash.get(_regressions_key, [])
+    if regressions:
+        terminalreporter.write_line("pytest-sentry: {} slow test regressions".format(len(regressions)))
+        for regression in sorted(regressions, key=lambda r: r["duration"] - r["median"], reverse=True):
+            terminalreporter.write_line(
+                "  {nodeid} ({phase}): {duration:.2f}s, median {median:.2f}s".format(**regression)
+            )
+
+    benchmark_regressions = terminalreporter.config.stash.get(_benchmark_regressions_key, [])
+    if benchmark_regressions:
+        terminalreporter.write_line("pytest-sentry: {} slow benchmark regressions".format(len(benchmark_regressions)))
+        for regression in sorted(benchmark_regressions, key=lambda r: r["median"] / r["previous_median"], reverse=True):
+            terminalreporter.write_line(
+                "  {nodeid}: median {median:.6f}s, previously {previous_median:.6f}s".format(**regression)
+            )
+
+    hotspots = terminalreporter.config.stash.get(_hotspot_totals_key, None)
+    if hotspots is not None and hotspots.samples:
+        terminalreporter.write_line(
+            "pytest-sentry: hottest functions in {} profiled tests ({} samples)".format(hotspots.tests, hotspots.samples)
+        )
+        terminalreporter.write_line("     self    total  function")
+        for name, self_share, total_share in hotspots.top(int(os.environ.get("PYTEST_SENTRY_PROFILE_TOP", 20))):
+            terminalreporter.write_line("  {:6.1%}  {:6.1%}  {}".format(self_share, total_share, name))
+
+    all_stats = terminalreporter.config.stash.get(_flush_stats_key, [])
+    clients = sum(stats["clients"] for stats in all_stats)
+    if not clients:
+        return
+
+    captured = sum(stats["captured"] for stats in all_stats)
+    dropped = sum(stats["dropped"] for stats in all_stats)
+    terminalreporter.write_line(
+        "pytest-sentry: {} envelopes delivered, {} dropped after flushing for {:.2f}s (budget {:.2f}s per process)".format(
+            captured - dropped,
+            dropped,
+            max(stats["duration"] for stats in all_stats),
+            max(stats["timeout"] for stats in all_stats),
+        )
+    )
+
+
+def _capture_failure(item, exc_info):
+    """
+    Sends an event for a test failure, unless failures with the same
+    fingerprint were already sent `max_events_per_failure` times.
+    """
+    # The exception chain of a rerun test is passed again with every rerun,
+    # but every exception is only counted and reported once.
+    counted = item.stash.setdefault(_item_counted_failures_key, [])
+    if any(exc_value is exc_info[1] for exc_value in counted):
+        return
+    counted.append(exc_info[1])
+
+    from .failures import FailureGroup, failure_fingerprint
+
+    isolation_scope = sentry_sdk.get_isolation_scope()
+    integration = sentry_sdk.get_client().get_integration(PytestIntegration)
+    key = isolation_scope, failure_fingerprint(exc_info, integration)
+
+    groups = item.config.stash.setdefault(_failure_groups_key, {})
+    if key not in groups:
+        groups[key] = FailureGroup(key[1])
+
+    if groups[key].add(item.nodeid, integration.max_events_per_failure):
+        sentry_sdk.capture_exception(exc_info)
+
+
+def _report_failure_groups(config):
+    """
+    Sends one event for every fingerprint that failed more often than it was
+    reported.
+    """
+    for (isolation_scope, _), group in config.stash.get(_failure_groups_key, {}).items():
+        if group.count > group.reported:
             with sentry_sdk.use_isolation_scope(isolation_scope):
-                gen = wrapped(*args, **kwargs)
+                sentry_sdk.capture_event(group.to_event())
 
-            while True:
-                try:
-                    with sentry_sdk.use_isolation_scope(isolation_scope):
-                        chunk = next(gen)
+    config.stash[_failure_groups_key] = {}
+
+
+def _get_baseline(config):
+    """
+    Returns the duration baseline if `PYTEST_SENTRY_BASELINE_PATH` is set.
+    """
+    path = config.stash.get(_baseline_path_key, None)
+    if path is None:
+        return None
+
+    if _baseline_key not in config.stash:
+        # Imported here, as `sqlite3` is only needed with a baseline.
+        from .baseline import DurationBaseline
+
+        config.stash[_baseline_key] = DurationBaseline(path)
+    return config.stash[_baseline_key]
+
+
+def _report_regressions(config):
+    """
+    Sends an event for every test whose setup or call phase was slower than
+    in previous runs, and adds the durations of this run to the baseline.
+    """
+    baseline = config.stash.get(_baseline_key, None)
+    if baseline is None:
+        return []
+
+    ratio = float(os.environ.get("PYTEST_SENTRY_REGRESSION_RATIO", 1.5))
+    min_delta = float(os.environ.get("PYTEST_SENTRY_REGRESSION_MIN_DELTA", 0.1))
+
+    regressions = []
+    for regression in baseline.find_regressions(ratio, min_delta):
+        item = regression.pop("item")
+        regressions.append(regression)
+
+        event = {
+            "level": "warning",
+            "message": "Slow test: {nodeid} ({phase}) took {duration:.2f}s, median {median:.2f}s".format(**regression),
+            "fingerprint": ["pytest-sentry-slow-test", regression["nodeid"], regression["phase"]],
+            "tags": {"pytest.phase": regression["phase"]},
+            "contexts": {"pytest_sentry.regression": dict(regression, ratio=ratio)},
+        }
+        trace_context = item.stash.get(_item_trace_context_key, None)
+        if trace_context is not None:
+            # Link the event to the spans of the slow run.
+            event["contexts"]["trace"] = trace_context
+
+        with sentry_sdk.use_isolation_scope(_resolve_item_scope(item)):
+            sentry_sdk.capture_event(event)
+
+    baseline.save()
+    config.stash.setdefault(_regressions_key, []).extend(regressions)
+    return regressions
+
+
+def _get_benchmark_baseline(config):
+    """
+    Returns the benchmark baseline if `PYTEST_SENTRY_BASELINE_PATH` is set.
+    """
+    path = config.stash.get(_baseline_path_key, None)
+    if path is None:
+        return None
+
+    if _benchmark_baseline_key not in config.stash:
+        from .baseline import BenchmarkBaseline
+
+        config.stash[_benchmark_baseline_key] = BenchmarkBaseline(path)
+    return config.stash[_benchmark_baseline_key]
+
+
+@contextlib.contextmanager
+def _report_benchmark(item, span=None):
+    """
+    If the test passed and used pytest-benchmark's `benchmark` fixture, sets
+    its stats as attributes of `span`, if any, and records them in the
+    benchmark baseline.
+    """
+    yield
+
+    fixture = getattr(item, "funcargs", {}).get("benchmark")
+    metadata = getattr(fixture, "stats", None)
+    stats = getattr(metadata, "stats", None)
+    if stats is None or not stats.rounds:
+        # The benchmark did not run, eg. with `--benchmark-disable`.
+        return
+
+    stats = {name: getattr(stats, name) for name in _BENCHMARK_STATS}
+    if span is not None:
+        for name, value in stats.items():
+            span.set_attribute("pytest-sentry.benchmark.{}".format(name), value)
+
+    baseline = _get_benchmark_baseline(item.config)
+    if baseline is not None:
+        baseline.record(item.nodeid, stats, item=item)
+
+
+def _report_benchmark_regressions(config):
+    """
+    Sends an event for every benchmark whose median got slower than in the
+    previous run, and stores the stats of this run.
+    """
+    baseline = config.stash.get(_benchmark_baseline_key, None)
+    if baseline is None:
+        return []
 
-                    y = yield chunk
+    ratio = float(os.environ.get("PYTEST_SENTRY_BENCHMARK_REGRESSION_RATIO", 1.2))
 
-                    with sentry_sdk.use_isolation_scope(isolation_scope):
-                        gen.send(y)
+    regressions = []
+    for regression in baseline.find_regressions(ratio):
+        item = regression.pop("item")
+        regressions.append({key: regression[key] for key in ("nodeid", "median", "previous_median")})
 
-                except StopIteration:
-                    break
+        event = {
+            "level": "warning",
+            "message": "Slow benchmark: {nodeid} median {median:.6f}s, previously {previous_median:.6f}s".format(
+                **regression
+            ),
+            "fingerprint": ["pytest-sentry-slow-benchmark", regression["nodeid"]],
+            "contexts": {"pytest_sentry.benchmark": dict(regression, ratio=ratio)},
+        }
+        trace_context = item.stash.get(_item_trace_context_key, None)
+        if trace_context is not None:
+            # Link the event to the spans of the slow run.
+            event["contexts"]["trace"] = trace_context
+
+        with sentry_sdk.use_isolation_scope(_resolve_item_scope(item)):
+            sentry_sdk.capture_event(event)
+
+    baseline.save()
+    config.stash.setdefault(_benchmark_regressions_key, []).extend(regressions)
+    return regressions
+
+
+def _should_profile(item):
+    """
+    Returns whether to sample the stack of `item`'s call phase: if it has the
+    `sentry_profile` marker, is one of the `PYTEST_SENTRY_PROFILE_SLOWEST`
+    slowest tests of the baseline, or is picked at `hotspot_sample_rate`.
+    """
+    if item.stash.get(_item_profile_key, False):
+        return True
+
+    sample_rate = sentry_sdk.get_client().get_integration(PytestIntegration).hotspot_sample_rate
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def _profile_test(item):
+    """
+    Returns a context manager that samples the stack of `item` into the
+    hotspots of the current isolation scope, if the test is selected.
+    """
+    if not _should_profile(item):
+        return contextlib.nullcontext()
+
+    # Imported here, as profiling is only needed for the selected tests.
+    from .profiling import Hotspots, StackSampler
+
+    all_hotspots = item.config.stash.setdefault(_hotspots_key, {})
+    isolation_scope = sentry_sdk.get_isolation_scope()
+    if isolation_scope not in all_hotspots:
+        all_hotspots[isolation_scope] = Hotspots()
+
+    return StackSampler(all_hotspots[isolation_scope])
+
+
+def _report_hotspots(config):
+    """
+    Sends the hotspots of every isolation scope as a `pytest.profile` span in
+    the session trace, and returns the hotspots of all scopes combined, or
+    `None` if no test was profiled.
+    """
+    all_hotspots = config.stash.get(_hotspots_key, {})
+    if not all_hotspots:
+        return config.stash.get(_hotspot_totals_key, None)
+
+    from .profiling import Hotspots
+
+    totals = config.stash.setdefault(_hotspot_totals_key, Hotspots())
+    top = int(os.environ.get("PYTEST_SENTRY_PROFILE_TOP", 20))
+    trees = config.stash.get(_span_trees_key, {})
+
+    for isolation_scope, hotspots in all_hotspots.items():
+        totals.update(hotspots)
+
+        tree = trees.get(isolation_scope)
+        with sentry_sdk.use_isolation_scope(isolation_scope):
+            with _start_span(
+                "pytest.profile",
+                "pytest.profile",
+                tree.session_span if tree is not None else None,
+                trace_headers=config.stash.get(_session_trace_headers_key, None),
+                sampled=True,
+            ) as span:
+                span.set_attribute("pytest-sentry.profile.tests", hotspots.tests)
+                span.set_attribute("pytest-sentry.profile.samples", hotspots.samples)
+                span.set_attribute(
+                    "pytest-sentry.profile.hotspots",
+                    [
+                        "{:.1%} self, {:.1%} total: {}".format(self_share, total_share, name)
+                        for name, self_share, total_share in hotspots.top(top)
+                    ],
+                )
+
+    config.stash[_hotspots_key] = {}
+    return totals
+
+
+def _get_aggregate(config):
+    """
+    Returns the aggregate of the current isolation scope.
+    """
+    aggregates = config.stash.setdefault(_aggregates_key, {})
+    isolation_scope = sentry_sdk.get_isolation_scope()
+    if isolation_scope not in aggregates:
+        from .aggregate import SessionAggregate
+
+        aggregates[isolation_scope] = SessionAggregate()
+    return aggregates[isolation_scope]
+
+
+def _aggregate_span(op, name, item, record):
+    """
+    A hook wrapper body for `aggregate_only` mode. Passes the duration to
+    `record` instead of starting a span, and only sends a transaction
+    afterwards if the hook failed or took at least `outlier_duration`.
+    """
+    integration = sentry_sdk.get_client().get_integration(PytestIntegration)
+    start_timestamp = time.time()
+    failed = True
+    try:
+        result = yield
+        failed = False
+    finally:
+        duration = time.time() - start_timestamp
+        record(_get_aggregate(item.config), duration)
+        if failed or duration >= integration.outlier_duration:
+            with _start_span(op, name, start_timestamp=start_timestamp) as span:
+                span.set_attribute("pytest-sentry.aggregate.reason", "failure" if failed else "outlier")
+
+    return result
+
+
+def _report_aggregates(config):
+    """
+    Sends one `pytest.session.summary` transaction per isolation scope in
+    `aggregate_only` mode.
+    """
+    start_timestamp = config.stash.get(_session_start_key, None)
+    headers = config.stash.get(_session_trace_headers_key, None)
+
+    for isolation_scope, aggregate in config.stash.get(_aggregates_key, {}).items():
+        with sentry_sdk.use_isolation_scope(isolation_scope):
+            with _start_span(
+                "pytest.session.summary",
+                "pytest.session.summary",
+                trace_headers=headers,
+                sampled=True,
+                start_timestamp=start_timestamp,
+            ) as span:
+                for outcome, count in aggregate.totals().items():
+                    span.set_attribute("pytest-sentry.tests.{}".format(outcome), count)
+                span.set_attribute("pytest-sentry.tests", len(aggregate.test_durations))
+                span.set_context("pytest_sentry.summary", aggregate.summary())
+
+    config.stash[_aggregates_key] = {}
+
+
+def _resource_usage(item):
+    """
+    Returns a `ResourceUsage` with the expensive collectors enabled by
+    `resource_collectors` or the `sentry_resources` marker.
+    """
+    config = item.config
+    resource_usage = config.stash.get(_resource_usage_key, None)
+    if resource_usage is None:
+        # Imported here, as `resource` is only needed for tests that report.
+        from .resources import ResourceUsage
+
+        resource_usage = config.stash[_resource_usage_key] = ResourceUsage
+
+    collectors = sentry_sdk.get_client().get_integration(PytestIntegration).resource_collectors
+
+    marker_collectors = item.stash.get(_item_resource_collectors_key, None)
+    if marker_collectors is not None:
+        collectors = collectors.union(marker_collectors)
+
+    return resource_usage(collectors)
+
+
+@contextlib.contextmanager
+def _measure_resources(item, span):
+    """
+    Sets the resources used while the context manager is active as
+    attributes of `span`.
+    """
+    usage = _resource_usage(item)
+    usage.start()
+    try:
+        yield
+    finally:
+        for key, value in usage.stop().items():
+            span.set_attribute(key, value)
+
+
+@contextlib.contextmanager
+def _propagate_trace(span):
+    """
+    With `propagate_to_subprocesses`, makes processes started while the
+    context manager is active continue the trace of `span`, and sets the CPU
+    time of those processes as attributes of `span`.
+    """
+    client = sentry_sdk.get_client()
+    integration = client.get_integration(PytestIntegration)
+    if not integration.propagate_to_subprocesses or not client.dsn:
+        yield
+        return
+
+    # Imported here, as `multiprocessing` is only needed with the option.
+    from .propagation import propagate_to_subprocesses
+
+    headers = dict(sentry_sdk.get_current_scope().iter_trace_propagation_headers())
+    with propagate_to_subprocesses(headers, client.dsn) as attributes:
+        yield
+    for key, value in attributes.items():
+        span.set_attribute(key, value)
+
+
+def hookwrapper(itemgetter, **kwargs):
+    """
+    A version of pytest.hookimpl that sets the current scope to the correct one
+    and skips the hook if the integration is disabled.
+
+    Assumes the function is a new-style hook wrapper, ie yields once and
+    returns the result. The isolation scope is only active while the wrapped
+    function runs, not while pytest runs the inner hook implementations.
+    """
 
     def inner(f):
-        return pytest.hookimpl(hookwrapper=True, **kwargs)(_with_isolation_scope(f))
+        @functools.wraps(f)
+        def _with_isolation_scope(*args):
+            isolation_scope = _resolve_item_scope(itemgetter(*args))
+
+            if isolation_scope.client.get_integration(PytestIntegration) is None:
+                return (yield)
+
+            gen = f(*args)
+            with sentry_sdk.use_isolation_scope(isolation_scope):
+                next(gen)
+
+            try:
+                result = yield
+            except BaseException as e:
+                with sentry_sdk.use_isolation_scope(isolation_scope):
+                    try:
+                        gen.throw(e)
+                    except StopIteration as stop:
+                        return stop.value
+            else:
+                with sentry_sdk.use_isolation_scope(isolation_scope):
+                    try:
+                        gen.send(result)
+                    except StopIteration as stop:
+                        return stop.value
+
+            raise RuntimeError("{} did not stop after yielding once".format(f.__name__))
+
+        return pytest.hookimpl(wrapper=True, **kwargs)(_with_isolation_scope)
 
     return inner
 
 
-@hookwrapper(itemgetter=lambda item: item)
-def pytest_runtest_protocol(item):
+def _sample_span(op, item, fixturedef=None):
+    """
+    Returns the sampling decision of the `span_sampler` option for a span, or
+    `None` if the client's own sampling should be used.
+    """
+    integration = sentry_sdk.get_client().get_integration(PytestIntegration)
+    if integration.span_sampler is None:
+        return None
+
+    sampling_context = {
+        "op": op,
+        "nodeid": item.nodeid,
+        "markers": [marker.name for marker in item.iter_markers()],
+        "fixture_name": fixturedef.argname if fixturedef is not None else None,
+        "fixture_scope": fixturedef.scope if fixturedef is not None else None,
+    }
+    sample_rate = integration.span_sampler(sampling_context)
+
+    if sample_rate is None or isinstance(sample_rate, bool):
+        return sample_rate
+
+    return random.random() < float(sample_rate)
+
+
+def _get_span_tree(item):
+    """
+    Returns the span tree of the current isolation scope, or `None` if
+    `hierarchical_spans` is disabled or `aggregate_only` is enabled.
+    """
+    integration = sentry_sdk.get_client().get_integration(PytestIntegration)
+    if not integration.hierarchical_spans or integration.aggregate_only:
+        return None
+
+    from .spans import get_span_tree
+
+    return get_span_tree(
+        item.config,
+        sentry_sdk.get_isolation_scope(),
+        item.config.stash.get(_session_trace_headers_key, None),
+    )
+
+
+@contextlib.contextmanager
+def _start_span(op, name, parent_span=None, trace_headers=None, **kwargs):
+    """
+    Starts a child span of `parent_span`, or a separate transaction if there
+    is no parent. The transaction continues `trace_headers`, or the trace of
+    the current isolation scope.
+    """
+    if parent_span is not None:
+        with parent_span.start_child(op=op, name=name, **kwargs) as span:
+            yield span
+    else:
+        if trace_headers is None:
+            trace_headers = dict(sentry_sdk.get_isolation_scope().iter_trace_propagation_headers())
+        with sentry_sdk.continue_trace(trace_headers):
+            with sentry_sdk.start_span(op=op, name=name, **kwargs) as span:
+                yield span
+
+
+@hookwrapper(itemgetter=lambda item, nextitem: item)
+def pytest_runtest_protocol(item, nextitem):
     """
     Pytest hook that is called when one test is run.
     The runtest protocol includes setup phase, call phase and teardown phase.
@@ -66,12 +903,69 @@ def pytest_runtest_protocol(item):
     op = "pytest.runtest.protocol"
     name = "{} {}".format(op, item.nodeid)
 
+    worker_id = _get_xdist_worker_id(item.config)
+    if worker_id is not None:
+        sentry_sdk.set_tag("pytest.xdist.worker", worker_id)
+
+    tree = _get_span_tree(item)
+    if tree is not None:
+        parent_span = tree.enter_item(item, functools.partial(_sample_span, "pytest.module", item))
+        test_span = item.stash[_item_test_span_key] = parent_span.start_child(op=op, name=name)
+        try:
+            return (yield)
+        finally:
+            test_span.finish()
+            del item.stash[_item_test_span_key]
+            tree.leave_item(item, nextitem)
+
     # We use the full name including parameters because then we can identify
     # how often a single test has run as part of the same GITHUB_RUN_ID.
     # Purposefully drop transaction to spare quota. We only created it to
     # have a trace_id to correlate by.
-    with sentry_sdk.start_span(op=op, name=name, sampled=False):
-        yield
+    if worker_id is None:
+        with sentry_sdk.start_span(op=op, name=name, sampled=False):
+            return (yield)
+
+    # With pytest-xdist, all workers continue the trace of the controller so
+    # that the whole session shows up as one trace.
+    with sentry_sdk.continue_trace(item.config.stash.get(_session_trace_headers_key, {})):
+        with sentry_sdk.start_span(op=op, name=name, sampled=False):
+            return (yield)
+
+
+def _runtest_phase(item, when):
+    tree = _get_span_tree(item)
+    test_span = item.stash.get(_item_test_span_key, None)
+    if tree is None or test_span is None:
+        return (yield)
+
+    op = "pytest.runtest.{}".format(when)
+    with test_span.start_child(op=op, name="{} {}".format(op, item.nodeid)) as span:
+        tree.phase_span = span
+        try:
+            return (yield)
+        finally:
+            tree.phase_span = None
+
+
+@hookwrapper(itemgetter=lambda item: item)
+def pytest_runtest_setup(item):
+    """
+    Pytest hook that is called when the setup phase of a test is run.
+    Only reported with `hierarchical_spans`.
+    See https://docs.pytest.org/en/stable/reference/reference.html#pytest.hookspec.pytest_runtest_setup
+    """
+    return (yield from _runtest_phase(item, "setup"))
+
+
+@hookwrapper(itemgetter=lambda item, nextitem: item)
+def pytest_runtest_teardown(item, nextitem):
+    """
+    Pytest hook that is called when the teardown phase of a test is run.
+    Only reported with `hierarchical_spans`.
+    See https://docs.pytest.org/en/stable/reference/reference.html#pytest.hookspec.pytest_runtest_teardown
+    """
+    return (yield from _runtest_phase(item, "teardown"))
 
 
 @hookwrapper(itemgetter=lambda item: item)
@@ -87,15 +981,95 @@ def pytest_runtest_call(item):
     else:
         name = "{} {}".format(op, item.nodeid)
 
+    integration = sentry_sdk.get_client().get_integration(PytestIntegration)
+    if integration.aggregate_only:
+        # There is no call span to attach resource usage, threads, processes
+        # or event loop callbacks to, but benchmarks are still compared with
+        # the baseline.
+        module = (item.getparent(pytest.File) or item.parent).nodeid
+        with _profile_test(item), _report_benchmark(item):
+            return (yield from _aggregate_span(
+                op, name, item, lambda aggregate, duration: aggregate.add_test(module, item.nodeid, duration)
+            ))
+
+    tree = _get_span_tree(item)
+    if tree is not None:
+        parent_span = item.stash.get(_item_test_span_key, None)
+        sampled = None
+    else:
+        parent_span = None
+        sampled = _sample_span(op, item)
+
     # We use the full name including parameters because then we can identify
     # how often a single test has run as part of the same GITHUB_RUN_ID.
-    with sentry_sdk.continue_trace(dict(sentry_sdk.get_isolation_scope().iter_trace_propagation_headers())):
-        with sentry_sdk.start_span(op=op, name=name) as span:
-            span.set_attribute("pytest-sentry.rerun", is_rerun)
-            if is_rerun:
-                span.set_attribute("pytest-sentry.execution_count", item.execution_count)
+    with _start_span(op, name, parent_span, sampled=sampled) as span:
+        item.stash[_item_trace_context_key] = {"trace_id": span.trace_id, "span_id": span.span_id}
+        span.set_attribute("pytest-sentry.rerun", is_rerun)
+        if is_rerun:
+            span.set_attribute("pytest-sentry.execution_count", item.execution_count)
+
+        item.stash[_item_call_span_key] = span
+        try:
+            with _profile_test(item), _measure_resources(item, span), _propagate_trace(span), \
+                    _report_benchmark(item, span):
+                if tree is None:
+                    return (yield)
+
+                tree.phase_span = span
+                try:
+                    return (yield)
+                finally:
+                    tree.phase_span = None
+        finally:
+            del item.stash[_item_call_span_key]
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_pyfunc_call(pyfuncitem):
+    """
+    Pytest hook that is called to run the test function. With
+    `slow_callback_duration` or `propagate_to_threads`, the test's isolation
+    scope and call span are current while the test function runs, so that
+    the tasks and threads it starts inherit them, and those are monitored.
+    See https://docs.pytest.org/en/stable/reference/reference.html#pytest.hookspec.pytest_pyfunc_call
+    """
+    span = pyfuncitem.stash.get(_item_call_span_key, None)
+    if span is None:
+        return (yield)
+
+    isolation_scope = _resolve_item_scope(pyfuncitem)
+    integration = isolation_scope.client.get_integration(PytestIntegration)
+    if integration is None or (integration.slow_callback_duration is None and not integration.propagate_to_threads):
+        return (yield)
+
+    # Unlike `hookwrapper`, the scope stays active while pytest runs the
+    # test function, and is propagated into the tasks the test runs.
+    with sentry_sdk.use_isolation_scope(isolation_scope):
+        span.activate()
+        monitors = []
+        if integration.slow_callback_duration is not None:
+            # Imported here, as `asyncio` is only needed with the option.
+            from .eventloop import EventLoopMonitor
+
+            monitors.append(EventLoopMonitor(
+                integration.slow_callback_duration,
+                propagate=functools.partial(otel_context.attach, otel_context.get_current()),
+                restore=otel_context.detach,
+            ))
+        if integration.propagate_to_threads:
+            from .threads import ThreadMonitor
+
+            monitors.append(ThreadMonitor())
 
-            yield
+        try:
+            with contextlib.ExitStack() as stack:
+                for monitor in monitors:
+                    stack.enter_context(monitor)
+                return (yield)
+        finally:
+            span.deactivate()
+            for monitor in monitors:
+                monitor.report(span)
 
 
 @hookwrapper(itemgetter=lambda fixturedef, request: request._pyfuncitem)
@@ -107,10 +1081,68 @@ def pytest_fixture_setup(fixturedef, request):
     op = "pytest.fixture.setup"
     name = "{} {}".format(op, fixturedef.argname)
 
-    with sentry_sdk.continue_trace(dict(sentry_sdk.get_isolation_scope().iter_trace_propagation_headers())):
-        with sentry_sdk.start_span(op=op, name=name) as root_span:
-            root_span.set_tag("pytest.fixture.scope", fixturedef.scope)
-            yield
+    integration = sentry_sdk.get_client().get_integration(PytestIntegration)
+    if integration.fixture_scopes is not None and fixturedef.scope not in integration.fixture_scopes:
+        return (yield)
+
+    if integration.aggregate_only:
+        return (yield from _aggregate_span(
+            op, name, request._pyfuncitem, lambda aggregate, duration: aggregate.add_fixture(fixturedef.argname, duration)
+        ))
+
+    tree = _get_span_tree(request._pyfuncitem)
+    if tree is not None:
+        parent_span = tree.phase_span
+        sampled = None
+    else:
+        parent_span = None
+        sampled = _sample_span(op, request._pyfuncitem, fixturedef)
+        if sampled is False:
+            return (yield)
+
+    if integration.fixture_min_duration is None:
+        with _start_span(op, name, parent_span, sampled=sampled) as span:
+            span.set_tag("pytest.fixture.scope", fixturedef.scope)
+            with _measure_resources(request._pyfuncitem, span):
+                result = yield
+    else:
+        # The duration is only known afterwards, so the span is created
+        # retroactively and fast fixtures never get one.
+        start_timestamp = time.time()
+        usage = _resource_usage(request._pyfuncitem)
+        usage.start()
+        try:
+            result = yield
+        finally:
+            attributes = usage.stop()
+            if time.time() - start_timestamp >= integration.fixture_min_duration:
+                with _start_span(op, name, parent_span, sampled=sampled, start_timestamp=start_timestamp) as span:
+                    span.set_tag("pytest.fixture.scope", fixturedef.scope)
+                    for key, value in attributes.items():
+                        span.set_attribute(key, value)
+
+    if tree is not None:
+        # Finalizers run in reverse order, so this one runs before the
+        # fixture's own teardown code.
+        fixturedef.addfinalizer(functools.partial(tree.fixture_teardown_started, fixturedef))
+
+    return result
+
+
+@hookwrapper(itemgetter=lambda fixturedef, request: request._pyfuncitem)
+def pytest_fixture_post_finalizer(fixturedef, request):
+    """
+    Pytest hook that is called after a fixture has been torn down.
+    Only reported with `hierarchical_spans`.
+    See: https://docs.pytest.org/en/stable/reference/reference.html#pytest.hookspec.pytest_fixture_post_finalizer
+    """
+    result = yield
+
+    tree = _get_span_tree(request._pyfuncitem)
+    if tree is not None:
+        tree.fixture_teardown_finished(fixturedef)
+
+    return result
 
 
 @hookwrapper(tryfirst=True, itemgetter=lambda item, call: item)
@@ -123,10 +1155,21 @@ def pytest_runtest_makereport(item, call):
     sentry_sdk.set_tag("pytest.result", "pending")
 
     report = yield
-    outcome = report.get_result().outcome
+    outcome = report.outcome
 
     sentry_sdk.set_tag("pytest.result", outcome)
 
+    integration = sentry_sdk.get_client().get_integration(PytestIntegration)
+    if integration.aggregate_only and (call.when == "call" or outcome != "passed"):
+        outcome_name = "error" if call.when != "call" and outcome == "failed" else outcome
+        _get_aggregate(item.config).add_outcome((item.getparent(pytest.File) or item.parent).nodeid, outcome_name)
+
+    baseline = _get_baseline(item.config)
+    if baseline is not None and call.when in ("setup", "call") and report.passed:
+        # Failing runs are often faster or slower for unrelated reasons, so
+        # only passing ones are compared and kept.
+        baseline.record(item.nodeid, call.when, call.duration, item=item)
+
     if call.when == "call" and outcome != "skipped":
         cur_exc_chain = getattr(item, "pytest_sentry_exc_chain", [])
 
@@ -135,9 +1178,11 @@ def pytest_runtest_makereport(item, call):
                 call.excinfo
             ]
 
-        isolation_scope = _resolve_scope_marker_value(item.get_closest_marker("sentry_client"))
+        isolation_scope = _resolve_item_scope(item)
         integration = isolation_scope.client.get_integration(PytestIntegration)
 
         if (cur_exc_chain and call.excinfo is None) or (integration is not None and integration.always_report):
             for exc_info in cur_exc_chain:
-                sentry_sdk.capture_exception((exc_info.type, exc_info.value, exc_info.tb))
+                _capture_failure(item, (exc_info.type, exc_info.value, exc_info.tb))
+
+    return report
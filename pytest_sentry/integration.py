@@ -4,14 +4,42 @@ import sentry_sdk
 from sentry_sdk.integrations import Integration
 from sentry_sdk.scope import add_global_event_processor
 
-from .consts import _ENVVARS_AS_TAGS
+from .consts import _DEFAULT_IN_APP_EXCLUDE, _ENVVARS_AS_TAGS
 
 
-def _process_stacktrace(stacktrace):
+_environ_tags = None
+
+
+def get_environ_tags(refresh=False):
+    """
+    Returns the CI environment variables that are attached to events as tags.
+
+    The environment is read once and reused for all events. Pass
+    `refresh=True` to read it again, eg. after changing `os.environ`.
+    """
+    global _environ_tags
+
+    if refresh or _environ_tags is None:
+        tags = {}
+        for key in _ENVVARS_AS_TAGS:
+            value = os.environ.get(key)
+            if value:
+                tags["pytest_environ.{}".format(key)] = value
+        _environ_tags = tags
+
+    return _environ_tags
+
+
+def _process_stacktrace(stacktrace, integration):
+    in_app_cache = integration._in_app_cache
     for frame in stacktrace["frames"]:
-        frame["in_app"] = not frame["module"].startswith(
-            ("_pytest.", "pytest.", "pluggy.")
-        )
+        module = frame.get("module")
+        abs_path = frame.get("abs_path")
+        key = module or abs_path
+        try:
+            frame["in_app"] = in_app_cache[key]
+        except KeyError:
+            frame["in_app"] = in_app_cache[key] = integration._is_in_app(module, abs_path)
 
 
 class PytestIntegration(Integration):
@@ -20,33 +48,183 @@ class PytestIntegration(Integration):
 
     identifier = "pytest"
 
-    def __init__(self, always_report=None):
+    def __init__(
+        self,
+        always_report=None,
+        in_app_exclude=None,
+        exclude_site_packages=False,
+        span_sampler=None,
+        fixture_scopes=None,
+        fixture_min_duration=None,
+        hierarchical_spans=None,
+        max_events_per_failure=None,
+        slow_callback_duration=None,
+        aggregate_only=None,
+        outlier_duration=None,
+        propagate_to_subprocesses=None,
+        propagate_to_threads=None,
+        resource_collectors=None,
+        hotspot_sample_rate=None,
+    ):
+        """
+        :param in_app_exclude: Module prefixes whose frames are not marked as
+            in-app. Defaults to pytest and pluggy.
+        :param exclude_site_packages: Also mark frames from files inside
+            `site-packages` or `dist-packages` as not in-app.
+        :param span_sampler: Called with a sampling context dict before a test
+            or fixture span is started. Returns a sample rate, a boolean, or
+            `None` to fall back to the client's sampling.
+        :param fixture_scopes: Only report fixture setup for fixtures with one
+            of these scopes. Defaults to all scopes.
+        :param fixture_min_duration: Only report fixture setup that took at
+            least this many seconds.
+        :param hierarchical_spans: Report session, module, class and test
+            spans with the test phases and fixtures nested below them,
+            instead of separate transactions per test and fixture.
+        :param max_events_per_failure: How many events to send for failures
+            with the same exception type and innermost in-app frame. Further
+            failures are only counted, and sent as one event listing the
+            affected tests at the end of the session. Defaults to 1.
+        :param slow_callback_duration: Monitor the asyncio event loop while a
+            test runs, and report callbacks that blocked it for at least this
+            many seconds as spans. Also makes the test's isolation scope and
+            call span current while the test function runs, so that spans
+            started in coroutines are part of the test.
+        :param aggregate_only: Instead of a transaction per test and fixture,
+            send one summary transaction per session with outcome counts and
+            duration percentiles per module and fixture. Only failed tests
+            and fixtures, and those taking at least `outlier_duration`
+            seconds, get their own transaction. Test calls have no span
+            then, so `slow_callback_duration`, `propagate_to_subprocesses`,
+            `propagate_to_threads` and resource usage have no effect.
+        :param outlier_duration: See `aggregate_only`. Defaults to 1 second.
+        :param propagate_to_subprocesses: Pass the trace of the running test
+            to the processes it starts through environment variables. Python
+            processes continue it with a `pytest.subprocess` transaction
+            carrying their CPU time.
+        :param propagate_to_threads: Run threads and `ThreadPoolExecutor`
+            tasks started by a test with the test's isolation scope and call
+            span, and report how long they ran as child spans.
+        :param resource_collectors: Expensive resource collectors, like
+            `tracemalloc` and `fds`, to run for every test call and fixture
+            setup span, not only for tests with the `sentry_resources`
+            marker.
+        :param hotspot_sample_rate: Fraction of tests whose stack is sampled
+            for the hotspot report, in addition to those with the
+            `sentry_profile` marker. Defaults to 0.
+        """
         if always_report is None:
             always_report = os.environ.get(
                 "PYTEST_SENTRY_ALWAYS_REPORT", ""
             ).lower() in ("1", "true", "yes")
 
+        if in_app_exclude is None:
+            in_app_exclude = _DEFAULT_IN_APP_EXCLUDE
+
+        if fixture_scopes is None:
+            fixture_scopes = os.environ.get("PYTEST_SENTRY_FIXTURE_SCOPES", "")
+            fixture_scopes = [scope.strip() for scope in fixture_scopes.split(",") if scope.strip()] or None
+
+        if fixture_min_duration is None:
+            fixture_min_duration = os.environ.get("PYTEST_SENTRY_FIXTURE_MIN_DURATION", None)
+            if fixture_min_duration is not None:
+                fixture_min_duration = float(fixture_min_duration)
+
+        if hierarchical_spans is None:
+            hierarchical_spans = os.environ.get(
+                "PYTEST_SENTRY_HIERARCHICAL_SPANS", ""
+            ).lower() in ("1", "true", "yes")
+
+        if max_events_per_failure is None:
+            max_events_per_failure = int(os.environ.get("PYTEST_SENTRY_MAX_EVENTS_PER_FAILURE", 1))
+
+        if slow_callback_duration is None:
+            slow_callback_duration = os.environ.get("PYTEST_SENTRY_SLOW_CALLBACK_DURATION", None)
+            if slow_callback_duration is not None:
+                slow_callback_duration = float(slow_callback_duration)
+
+        if aggregate_only is None:
+            aggregate_only = os.environ.get(
+                "PYTEST_SENTRY_AGGREGATE_ONLY", ""
+            ).lower() in ("1", "true", "yes")
+
+        if outlier_duration is None:
+            outlier_duration = float(os.environ.get("PYTEST_SENTRY_OUTLIER_DURATION", 1.0))
+
+        if propagate_to_subprocesses is None:
+            propagate_to_subprocesses = os.environ.get(
+                "PYTEST_SENTRY_PROPAGATE_SUBPROCESSES", ""
+            ).lower() in ("1", "true", "yes")
+
+        if propagate_to_threads is None:
+            propagate_to_threads = os.environ.get(
+                "PYTEST_SENTRY_PROPAGATE_THREADS", ""
+            ).lower() in ("1", "true", "yes")
+
+        if resource_collectors is None:
+            resource_collectors = os.environ.get("PYTEST_SENTRY_RESOURCE_COLLECTORS", "")
+            resource_collectors = [collector.strip() for collector in resource_collectors.split(",") if collector.strip()]
+
+        if hotspot_sample_rate is None:
+            hotspot_sample_rate = float(os.environ.get("PYTEST_SENTRY_HOTSPOT_SAMPLE_RATE", 0.0))
+
         self.always_report = always_report
+        self.in_app_exclude = tuple(in_app_exclude)
+        self.exclude_site_packages = exclude_site_packages
+        self.span_sampler = span_sampler
+        self.fixture_scopes = frozenset(fixture_scopes) if fixture_scopes is not None else None
+        self.fixture_min_duration = fixture_min_duration
+        self.hierarchical_spans = hierarchical_spans
+        self.max_events_per_failure = max_events_per_failure
+        self.slow_callback_duration = slow_callback_duration
+        self.aggregate_only = aggregate_only
+        self.outlier_duration = outlier_duration
+        self.propagate_to_subprocesses = propagate_to_subprocesses
+        self.propagate_to_threads = propagate_to_threads
+        self.resource_collectors = frozenset(resource_collectors)
+        self.hotspot_sample_rate = hotspot_sample_rate
+
+        # A module's frames are always classified the same way, so the result
+        # is cached per module name.
+        self._in_app_cache = {}
+        self._in_app_exclude_prefixes = tuple(
+            prefix.rstrip(".") + "." for prefix in self.in_app_exclude
+        )
+        self._in_app_exclude_names = frozenset(
+            prefix.rstrip(".") for prefix in self.in_app_exclude
+        )
+
+    def _is_in_app(self, module, abs_path):
+        if module:
+            if module in self._in_app_exclude_names:
+                return False
+            if module.startswith(self._in_app_exclude_prefixes):
+                return False
+
+        if self.exclude_site_packages and abs_path:
+            if "site-packages" in abs_path or "dist-packages" in abs_path:
+                return False
+
+        return True
 
     @staticmethod
     def setup_once():
         @add_global_event_processor
         def processor(event, hint):
-            if sentry_sdk.get_client().get_integration(PytestIntegration) is None:
+            integration = sentry_sdk.get_client().get_integration(PytestIntegration)
+            if integration is None:
                 return event
 
-            for key in _ENVVARS_AS_TAGS:
-                value = os.environ.get(key)
-                if not value:
-                    continue
-                event.setdefault("tags", {})["pytest_environ.{}".format(key)] = value
+            environ_tags = get_environ_tags()
+            if environ_tags:
+                event.setdefault("tags", {}).update(environ_tags)
 
             if "exception" in event:
                 for exception in event["exception"]["values"]:
                     if "stacktrace" in exception:
-                        _process_stacktrace(exception["stacktrace"])
+                        _process_stacktrace(exception["stacktrace"], integration)
 
             if "stacktrace" in event:
-                _process_stacktrace(event["stacktrace"])
+                _process_stacktrace(event["stacktrace"], integration)
 
             return event
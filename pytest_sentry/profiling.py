@@ -0,0 +1,124 @@
+import collections
+import sys
+import threading
+
+from .consts import _DEFAULT_IN_APP_EXCLUDE
+
+
+_DEFAULT_INTERVAL = 0.005
+
+# Sampling stops walking a stack at the first pytest or pluggy frame, so that
+# only the test function and the code it calls are counted.
+_STOP_PREFIXES = tuple(prefix + "." for prefix in _DEFAULT_IN_APP_EXCLUDE)
+_STOP_NAMES = frozenset(_DEFAULT_IN_APP_EXCLUDE)
+
+
+def _function_name(frame):
+    code = frame.f_code
+    return "{}.{}".format(
+        frame.f_globals.get("__name__", "?"), getattr(code, "co_qualname", code.co_name)
+    )
+
+
+class Hotspots(object):
+    """
+    Sampled stacks of the profiled tests, aggregated per function.
+
+    `self_counts` counts the samples in which a function was running itself,
+    `total_counts` the samples in which it was anywhere on the stack.
+    """
+
+    def __init__(self):
+        self.samples = 0
+        self.tests = 0
+        self.self_counts = collections.Counter()
+        self.total_counts = collections.Counter()
+
+    def add_stack(self, frame):
+        names = []
+        while frame is not None:
+            module = frame.f_globals.get("__name__", "")
+            if names and (module in _STOP_NAMES or module.startswith(_STOP_PREFIXES)):
+                break
+            names.append(_function_name(frame))
+            frame = frame.f_back
+
+        self.samples += 1
+        self.self_counts[names[0]] += 1
+        self.total_counts.update(set(names))
+
+    def update(self, other):
+        self.samples += other.samples
+        self.tests += other.tests
+        self.self_counts.update(other.self_counts)
+        self.total_counts.update(other.total_counts)
+
+    def top(self, n):
+        """
+        Returns up to `n` (function, self share, total share) tuples, hottest
+        function first.
+        """
+        if not self.samples:
+            return []
+
+        return [
+            (name, count / self.samples, self.total_counts[name] / self.samples)
+            for name, count in self.self_counts.most_common(n)
+        ]
+
+    def to_dict(self):
+        return {
+            "samples": self.samples,
+            "tests": self.tests,
+            "self_counts": dict(self.self_counts),
+            "total_counts": dict(self.total_counts),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        rv = cls()
+        rv.samples = data["samples"]
+        rv.tests = data["tests"]
+        rv.self_counts.update(data["self_counts"])
+        rv.total_counts.update(data["total_counts"])
+        return rv
+
+
+class StackSampler(object):
+    """
+    Samples the stack of the calling thread from a background thread every
+    `interval` seconds, between `start` and `stop`.
+    """
+
+    def __init__(self, hotspots, interval=_DEFAULT_INTERVAL):
+        self.hotspots = hotspots
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _run(self, thread_id):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                self.hotspots.add_stack(frame)
+
+    def start(self):
+        self.hotspots.tests += 1
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(threading.get_ident(),),
+            name="pytest-sentry.profiler",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
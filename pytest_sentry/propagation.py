@@ -0,0 +1,123 @@
+import atexit
+import contextlib
+import multiprocessing.util
+import os
+import sys
+
+import sentry_sdk
+from sentry_sdk.scope import ScopeType
+
+
+# Environment variables through which a test passes its trace to the
+# processes it starts.
+TRACE_ENV = "PYTEST_SENTRY_TRACE"
+BAGGAGE_ENV = "PYTEST_SENTRY_BAGGAGE"
+DSN_ENV = "PYTEST_SENTRY_SUBPROCESS_DSN"
+
+# Contains the `sitecustomize` module that runs `bootstrap()` in every Python
+# interpreter started with it on `PYTHONPATH`.
+BOOTSTRAP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "_bootstrap")
+
+_bootstrapped = False
+
+
+class _AfterFork(object):
+    # `multiprocessing.util.register_after_fork` only holds a weak reference
+    # to this, so the registration ends with `propagate_to_subprocesses`.
+    pass
+
+
+@contextlib.contextmanager
+def propagate_to_subprocesses(headers, dsn):
+    """
+    Exports the trace propagation `headers` and `dsn` into `os.environ`, so
+    that Python processes started while the context manager is active
+    continue the trace, and report a `pytest.subprocess` transaction with
+    their CPU time to `dsn`.
+
+    Yields a dict that receives the CPU time of child processes that were
+    waited for in the meantime, in seconds, as `pytest-sentry.subprocess.*`
+    attributes.
+    """
+    saved = {key: os.environ.get(key) for key in (TRACE_ENV, BAGGAGE_ENV, DSN_ENV, "PYTHONPATH")}
+    os.environ[TRACE_ENV] = headers["sentry-trace"]
+    if headers.get("baggage"):
+        os.environ[BAGGAGE_ENV] = headers["baggage"]
+    os.environ[DSN_ENV] = dsn
+    os.environ["PYTHONPATH"] = os.pathsep.join(
+        [BOOTSTRAP_DIR] + [path for path in (saved["PYTHONPATH"] or "").split(os.pathsep) if path]
+    )
+
+    # Forked `multiprocessing` workers do not start a new interpreter.
+    after_fork = _AfterFork()
+    multiprocessing.util.register_after_fork(after_fork, lambda _: bootstrap())
+
+    attributes = {}
+    start_times = os.times()
+    try:
+        yield attributes
+    finally:
+        end_times = os.times()
+        attributes["pytest-sentry.subprocess.cpu.user"] = end_times.children_user - start_times.children_user
+        attributes["pytest-sentry.subprocess.cpu.system"] = end_times.children_system - start_times.children_system
+
+        del after_fork
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def bootstrap():
+    """
+    Continues the trace of the test that started this process, if any, with
+    a `pytest.subprocess` transaction that is finished when the process
+    exits.
+    """
+    global _bootstrapped
+
+    trace = os.environ.get(TRACE_ENV)
+    dsn = os.environ.get(DSN_ENV)
+    if not trace or not dsn or _bootstrapped:
+        return
+    _bootstrapped = True
+
+    from .client import Client
+    from .helpers import _setup_scope_context_management
+
+    _setup_scope_context_management()
+    client = Client(dsn=dsn)
+    scope = sentry_sdk.Scope(ty=ScopeType.ISOLATION)
+    scope.set_client(client)
+
+    headers = {"sentry-trace": trace, "baggage": os.environ.get(BAGGAGE_ENV, "")}
+    start_times = os.times()
+    with sentry_sdk.use_isolation_scope(scope):
+        with sentry_sdk.continue_trace(headers):
+            span = sentry_sdk.start_span(op="pytest.subprocess", name=" ".join(getattr(sys, "orig_argv", sys.argv)) or sys.executable)
+
+    finished = []
+
+    def finish():
+        if finished:
+            return
+        finished.append(True)
+
+        # Spawned `multiprocessing` workers only know that they are one
+        # after `bootstrap()` ran.
+        if multiprocessing.parent_process() is not None:
+            span.name = multiprocessing.current_process().name
+
+        end_times = os.times()
+        span.set_attribute("pytest-sentry.pid", os.getpid())
+        span.set_attribute("pytest-sentry.cpu.user", end_times.user - start_times.user)
+        span.set_attribute("pytest-sentry.cpu.system", end_times.system - start_times.system)
+        with sentry_sdk.use_isolation_scope(scope):
+            span.finish()
+        client.close()
+
+    # `multiprocessing` workers exit without running `atexit` handlers, but
+    # run finalizers with an exit priority.
+    atexit.register(finish)
+    multiprocessing.util.Finalize(None, finish, exitpriority=0)
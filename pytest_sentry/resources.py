@@ -0,0 +1,120 @@
+import gc
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Collectors that are too expensive to run for every span, and are only
+# enabled by the `sentry_resources` marker or `PYTEST_SENTRY_RESOURCE_COLLECTORS`.
+EXPENSIVE_COLLECTORS = ("tracemalloc", "fds")
+
+# ru_maxrss is in kilobytes on Linux, but in bytes on macOS.
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+_gc_collections = 0
+_gc_time = 0.0
+_gc_start = None
+_gc_callback_installed = False
+
+
+def _gc_callback(phase, info):
+    global _gc_collections, _gc_time, _gc_start
+
+    if phase == "start":
+        _gc_start = time.perf_counter()
+    elif _gc_start is not None:
+        _gc_collections += 1
+        _gc_time += time.perf_counter() - _gc_start
+        _gc_start = None
+
+
+def _install_gc_callback():
+    global _gc_callback_installed
+
+    if not _gc_callback_installed:
+        gc.callbacks.append(_gc_callback)
+        _gc_callback_installed = True
+
+
+def _count_fds():
+    for path in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            pass
+    return None
+
+
+class ResourceUsage(object):
+    """
+    Measures the resources used between `start` and `stop`: CPU time, growth
+    of the peak RSS, and garbage collections. `collectors` enables the
+    `EXPENSIVE_COLLECTORS`: the peak of memory allocated through Python
+    (`tracemalloc`) and the change in open file descriptors (`fds`).
+    """
+
+    def __init__(self, collectors=()):
+        self.collectors = frozenset(collectors)
+        self._started_tracemalloc = False
+
+    def start(self):
+        _install_gc_callback()
+        self._gc_collections = _gc_collections
+        self._gc_time = _gc_time
+
+        if resource is not None:
+            self._rusage = resource.getrusage(resource.RUSAGE_SELF)
+
+        if "fds" in self.collectors:
+            self._fds = _count_fds()
+
+        if "tracemalloc" in self.collectors:
+            import tracemalloc
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            elif hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            else:
+                # Python 3.8 cannot reset the peak of tracing started by
+                # someone else, so the peak is not measured.
+                self._traced = None
+                return
+            self._traced = tracemalloc.get_traced_memory()[0]
+
+    def stop(self):
+        """
+        Returns the measurements as a dict of span attributes.
+        """
+        attributes = {}
+
+        if "tracemalloc" in self.collectors:
+            import tracemalloc
+
+            if self._traced is not None:
+                attributes["pytest-sentry.tracemalloc.peak"] = tracemalloc.get_traced_memory()[1] - self._traced
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+
+        if "fds" in self.collectors and self._fds is not None:
+            fds = _count_fds()
+            if fds is not None:
+                attributes["pytest-sentry.fds.delta"] = fds - self._fds
+
+        if resource is not None:
+            rusage = resource.getrusage(resource.RUSAGE_SELF)
+            attributes["pytest-sentry.cpu.user"] = rusage.ru_utime - self._rusage.ru_utime
+            attributes["pytest-sentry.cpu.system"] = rusage.ru_stime - self._rusage.ru_stime
+            attributes["pytest-sentry.rss.peak_delta"] = (rusage.ru_maxrss - self._rusage.ru_maxrss) * _MAXRSS_UNIT
+
+        attributes["pytest-sentry.gc.collections"] = _gc_collections - self._gc_collections
+        attributes["pytest-sentry.gc.time"] = _gc_time - self._gc_time
+
+        return attributes
@@ -0,0 +1,291 @@
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+import pytest
+
+from .failures import failure_fingerprint
+from .integration import PytestIntegration
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT NOT NULL PRIMARY KEY,
+    started REAL NOT NULL,
+    finished REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tests (
+    run_id TEXT NOT NULL,
+    nodeid TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    reruns INTEGER NOT NULL,
+    setup REAL,
+    call REAL,
+    teardown REAL,
+    fingerprint TEXT
+);
+CREATE INDEX IF NOT EXISTS tests_nodeid ON tests (nodeid, run_id);
+CREATE INDEX IF NOT EXISTS tests_run_id ON tests (run_id);
+CREATE TABLE IF NOT EXISTS fixtures (
+    run_id TEXT NOT NULL,
+    nodeid TEXT NOT NULL,
+    baseid TEXT NOT NULL,
+    argname TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fixtures_run_id ON fixtures (run_id);
+"""
+
+_INSERTS = {
+    "runs": "INSERT OR REPLACE INTO runs VALUES (?, ?, ?)",
+    "tests": "INSERT INTO tests VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+    "fixtures": "INSERT INTO fixtures VALUES (?, ?, ?, ?, ?, ?)",
+}
+
+_LAST_RUNS = "SELECT run_id FROM runs ORDER BY started DESC LIMIT ?"
+
+_STOP = object()
+
+
+def _format_fingerprint(fingerprint):
+    exc_type, path, lineno, func = fingerprint
+    if path is None:
+        return exc_type
+    return "{} at {}:{} in {}".format(exc_type, path, lineno, func)
+
+
+class RunStore(object):
+    """
+    A local SQLite store of the results of every test and the setup times of
+    its fixtures, for a number of test runs. Rows are only ever appended.
+
+    A run is only listed in `runs` once its session finished, so the queries
+    ignore runs that were interrupted.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        # pytest-xdist workers append to the same file concurrently.
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def _query(self, sql, *params):
+        conn = self.connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def slowest_fixtures(self, runs=10, limit=20):
+        """
+        Returns the fixtures that took the most setup time per run in the
+        last `runs` runs, as (baseid, argname, scope, setups, mean duration,
+        max duration, total duration per run) tuples.
+        """
+        return self._query(
+            "SELECT baseid, argname, scope, COUNT(*), AVG(duration), MAX(duration),"
+            " SUM(duration) / COUNT(DISTINCT run_id) AS per_run"
+            " FROM fixtures WHERE run_id IN (" + _LAST_RUNS + ")"
+            " GROUP BY baseid, argname, scope ORDER BY per_run DESC LIMIT ?",
+            runs,
+            limit,
+        )
+
+    def flakiest_tests(self, runs=10, limit=20):
+        """
+        Returns the tests that were flaky in the most of the last `runs`
+        runs, ie. needed reruns, or failed in some runs but passed in others.
+        Returns (nodeid, runs, flaky runs, reruns, failed runs) tuples.
+        """
+        return self._query(
+            "SELECT nodeid, runs, rerun_runs + MIN(failed, passed) AS flaky, reruns, failed FROM ("
+            " SELECT nodeid, COUNT(*) AS runs, SUM(reruns > 0) AS rerun_runs, SUM(reruns) AS reruns,"
+            " SUM(outcome IN ('failed', 'error')) AS failed, SUM(outcome = 'passed') AS passed"
+            " FROM tests WHERE run_id IN (" + _LAST_RUNS + ") GROUP BY nodeid"
+            ") WHERE flaky > 0 ORDER BY flaky * 1.0 / runs DESC, flaky DESC, nodeid LIMIT ?",
+            runs,
+            limit,
+        )
+
+    def trend(self, nodeid, runs=10):
+        """
+        Returns the results of `nodeid` in the last `runs` runs it ran in,
+        oldest first, as (started, outcome, reruns, setup, call, teardown)
+        tuples.
+        """
+        rows = self._query(
+            "SELECT runs.started, outcome, reruns, setup, call, teardown"
+            " FROM tests JOIN runs USING (run_id) WHERE nodeid = ?"
+            " ORDER BY runs.started DESC LIMIT ?",
+            nodeid,
+            runs,
+        )
+        rows.reverse()
+        return rows
+
+
+class RunStoreWriter(object):
+    """
+    Appends rows to a `RunStore` from a background thread, committing them
+    in batches every `flush_interval` seconds, so that tests do not wait for
+    the disk.
+    """
+
+    def __init__(self, store, flush_interval=0.5):
+        self.store = store
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="pytest-sentry.RunStoreWriter", daemon=True)
+        self._thread.start()
+
+    def add(self, table, row):
+        self._queue.put((table, row))
+
+    def _run(self):
+        conn = self.store.connect()
+        try:
+            done = False
+            while not done:
+                rows = {}
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    try:
+                        entry = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if entry is _STOP:
+                        done = True
+                        break
+                    table, row = entry
+                    rows.setdefault(table, []).append(row)
+
+                if rows:
+                    with conn:
+                        for table, table_rows in rows.items():
+                            conn.executemany(_INSERTS[table], table_rows)
+        finally:
+            conn.close()
+
+    def close(self):
+        """
+        Writes the remaining rows and waits for the writer thread to finish.
+        """
+        self._queue.put(_STOP)
+        self._thread.join()
+
+
+class RunStorePlugin(object):
+    """
+    Records the outcome, reruns, phase durations and failure fingerprint of
+    every test, and the setup times of fixtures, into the run store at
+    `path`.
+
+    Registered by `pytest_configure` if `--sentry-store` is used,
+    independently of whether tests report to Sentry. With pytest-xdist, the
+    workers record the tests they run under the run ID of the controller.
+    """
+
+    def __init__(self, config, path):
+        self.config = config
+        self.path = path
+        workerinput = getattr(config, "workerinput", None)
+        self.is_worker = workerinput is not None
+        self.run_id = (workerinput or {}).get("pytest_sentry_run_id") or uuid.uuid4().hex
+        self.started = time.time()
+        self._tests = {}
+        self._integration = PytestIntegration()
+        self._writer = None
+
+    def _records_tests(self):
+        # The controller of pytest-xdist only sees the reports of the workers,
+        # which record the tests themselves.
+        return not self.config.pluginmanager.has_plugin("dsession")
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_configure_node(self, node):
+        node.workerinput["pytest_sentry_run_id"] = self.run_id
+
+    def pytest_sessionstart(self, session):
+        self._writer = RunStoreWriter(RunStore(self.path))
+
+    @pytest.hookimpl(wrapper=True)
+    def pytest_fixture_setup(self, fixturedef, request):
+        start = time.perf_counter()
+        try:
+            return (yield)
+        finally:
+            self._writer.add("fixtures", (
+                self.run_id,
+                request._pyfuncitem.nodeid,
+                fixturedef.baseid,
+                fixturedef.argname,
+                fixturedef.scope,
+                time.perf_counter() - start,
+            ))
+
+    @pytest.hookimpl(wrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        report = yield
+        if call.excinfo is not None and report.failed:
+            test = self._tests.setdefault(item.nodeid, {"reruns": 0})
+            exc_info = (call.excinfo.type, call.excinfo.value, call.excinfo.tb)
+            test["fingerprint"] = _format_fingerprint(failure_fingerprint(exc_info, self._integration))
+        return report
+
+    def pytest_runtest_logreport(self, report):
+        if not self._records_tests():
+            return
+
+        test = self._tests.setdefault(report.nodeid, {"reruns": 0})
+        test[report.when] = report.duration
+
+        if report.outcome == "rerun":
+            test["reruns"] += 1
+            test["rerunning"] = True
+            return
+
+        wasxfail = hasattr(report, "wasxfail")
+        if report.when == "call":
+            if wasxfail:
+                test["outcome"] = "xfailed" if report.skipped else "xpassed"
+            else:
+                test["outcome"] = report.outcome
+        elif report.failed and test.get("outcome") != "failed":
+            test["outcome"] = "error"
+        elif report.skipped and report.when == "setup":
+            test["outcome"] = "xfailed" if wasxfail else "skipped"
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        test = self._tests.get(nodeid)
+        if test is None or not self._records_tests():
+            return
+
+        # pytest-rerunfailures runs the whole protocol again for a rerun, the
+        # test is recorded once after its last attempt.
+        if test.pop("rerunning", False):
+            return
+        del self._tests[nodeid]
+
+        self._writer.add("tests", (
+            self.run_id,
+            nodeid,
+            test.get("outcome", "passed"),
+            test["reruns"],
+            test.get("setup"),
+            test.get("call"),
+            test.get("teardown"),
+            test.get("fingerprint"),
+        ))
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_sessionfinish(self, session):
+        if not self.is_worker:
+            self._writer.add("runs", (self.run_id, self.started, time.time()))
+        self._writer.close()
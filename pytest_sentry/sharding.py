@@ -0,0 +1,227 @@
+import collections
+import json
+import os
+import statistics
+import time
+
+import pytest
+
+
+_INDEX_VERSION = 1
+
+
+def _fixture_key(fixturedef):
+    return "{}::{}".format(fixturedef.baseid, fixturedef.argname)
+
+
+def _fixture_instance(item, fixturedef):
+    """
+    Returns a key for the instance of a fixture with a scope wider than
+    "function" that `item` uses, eg. the module for module-scoped fixtures.
+    """
+    scope = fixturedef.scope
+    if scope == "session":
+        node = None
+    elif scope == "package":
+        node = item.getparent(pytest.Package) or item.getparent(pytest.Dir)
+    elif scope == "module":
+        node = item.getparent(pytest.Module)
+    else:
+        node = item.getparent(pytest.Class) or item.getparent(pytest.Module)
+
+    return _fixture_key(fixturedef), node.nodeid if node is not None else ""
+
+
+def _shared_fixturedefs(item):
+    fixtureinfo = getattr(item, "_fixtureinfo", None)
+    if fixtureinfo is None:
+        return []
+
+    return [
+        fixturedefs[-1]
+        for fixturedefs in fixtureinfo.name2fixturedefs.values()
+        if fixturedefs and fixturedefs[-1].scope != "function"
+    ]
+
+
+class DurationsIndex(object):
+    """
+    The expected durations of tests and of the setup of fixtures shared by
+    several tests, stored as a JSON file.
+
+    The duration of a test excludes setting up its shared fixtures, as only
+    the first test using a fixture instance pays for it.
+    """
+
+    def __init__(self, tests=None, fixtures=None):
+        self.tests = tests or {}
+        self.fixtures = fixtures or {}
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls()
+
+        if data.get("version") != _INDEX_VERSION:
+            return cls()
+        return cls(data["tests"], data["fixtures"])
+
+    def save(self, path):
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {"version": _INDEX_VERSION, "tests": self.tests, "fixtures": self.fixtures},
+                f,
+                indent=0,
+                sort_keys=True,
+            )
+        os.replace(tmp_path, path)
+
+    def update(self, tests, fixtures):
+        self.tests.update(tests)
+        self.fixtures.update(fixtures)
+
+    def plan(self, items, shards):
+        """
+        Splits `items` into `shards` lists with about the same expected
+        duration.
+
+        Tests sharing a module- or class-scoped fixture are kept together, so
+        that the fixture is only set up in one shard. Package- and
+        session-scoped fixtures count towards a shard once, for the first of
+        its tests that uses them.
+
+        The plan only depends on the items and the index, so every shard of
+        a CI run computes the same one.
+        """
+        # Tests that are not in the index yet are expected to take as long
+        # as the typical test.
+        default = statistics.median(self.tests.values()) if self.tests else 1.0
+
+        # Tests sharing a module- or class-scoped fixture are bundled into one
+        # unit with the cost of all its tests and those fixtures.
+        units = {}
+        for item in items:
+            local, shared = set(), set()
+            for fixturedef in _shared_fixturedefs(item):
+                instance = _fixture_instance(item, fixturedef)
+                (local if fixturedef.scope in ("module", "class") else shared).add(instance)
+
+            key = item.getparent(pytest.Module).nodeid if local else item.nodeid
+            unit = units.setdefault(key, {"items": [], "cost": 0.0, "local": set(), "shared": set()})
+            unit["items"].append(item)
+            unit["cost"] += self.tests.get(item.nodeid, default)
+            unit["local"].update(local)
+            unit["shared"].update(shared)
+
+        for unit in units.values():
+            unit["cost"] += sum(self.fixtures.get(fixture, 0.0) for fixture, _ in unit["local"])
+
+        plan = [[] for _ in range(shards)]
+        loads = [0.0] * shards
+        paid = [set() for _ in range(shards)]
+
+        # Longest processing time first: every unit goes to the shard that
+        # ends up with the lowest expected duration.
+        for key, unit in sorted(units.items(), key=lambda entry: (-entry[1]["cost"], entry[0])):
+            best_shard = best_load = None
+            for shard in range(shards):
+                load = loads[shard] + unit["cost"] + sum(
+                    self.fixtures.get(fixture, 0.0) for fixture, _ in unit["shared"] - paid[shard]
+                )
+                if best_load is None or load < best_load:
+                    best_shard, best_load = shard, load
+
+            plan[best_shard].extend(unit["items"])
+            loads[best_shard] = best_load
+            paid[best_shard].update(unit["shared"])
+
+        return plan
+
+
+def parse_shard(value):
+    """
+    Parses a `K/N` shard option into a (K, N) tuple.
+    """
+    try:
+        shard, shards = (int(part) for part in value.split("/"))
+    except ValueError:
+        shard = shards = 0
+
+    if not 1 <= shard <= shards:
+        raise pytest.UsageError(
+            "--sentry-shard must be K/N with 1 <= K <= N, not {!r}".format(value)
+        )
+    return shard, shards
+
+
+class ShardingPlugin(object):
+    """
+    Records the durations of tests and shared fixtures into the durations
+    index at `path`, and runs only the tests of `shard` out of `shards` if
+    given.
+
+    Registered by `pytest_configure` if `--sentry-durations` or
+    `--sentry-shard` is used, independently of whether tests report to Sentry.
+    """
+
+    def __init__(self, config, path, shard=None, shards=None):
+        self.config = config
+        self.path = path
+        self.shard = shard
+        self.shards = shards
+        self.tests = collections.defaultdict(float)
+        self.fixtures = {}
+        self._shared_setup = collections.defaultdict(float)
+
+    def pytest_collection_modifyitems(self, session, config, items):
+        if self.shard is None:
+            return
+
+        index = DurationsIndex.load(self.path) if self.path else DurationsIndex()
+        selected = set(id(item) for item in index.plan(items, self.shards)[self.shard - 1])
+        deselected = [item for item in items if id(item) not in selected]
+        if deselected:
+            config.hook.pytest_deselected(items=deselected)
+            items[:] = [item for item in items if id(item) in selected]
+
+    @pytest.hookimpl(wrapper=True)
+    def pytest_fixture_setup(self, fixturedef, request):
+        start = time.perf_counter()
+        try:
+            return (yield)
+        finally:
+            if fixturedef.scope != "function":
+                duration = time.perf_counter() - start
+                self.fixtures[_fixture_key(fixturedef)] = duration
+                self._shared_setup[request._pyfuncitem.nodeid] += duration
+
+    def pytest_runtest_logreport(self, report):
+        duration = report.duration
+        if report.when == "setup":
+            duration -= self._shared_setup.pop(report.nodeid, 0.0)
+        self.tests[report.nodeid] += max(duration, 0.0)
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):
+        durations = getattr(node, "workeroutput", {}).get("pytest_sentry_durations")
+        if durations is not None:
+            self.tests.update(durations["tests"])
+            self.fixtures.update(durations["fixtures"])
+
+    def pytest_sessionfinish(self, session):
+        if not self.path or not self.tests:
+            return
+
+        workeroutput = getattr(self.config, "workeroutput", None)
+        if workeroutput is not None:
+            # The controller writes the index for all workers.
+            workeroutput["pytest_sentry_durations"] = {"tests": dict(self.tests), "fixtures": self.fixtures}
+            return
+
+        index = DurationsIndex.load(self.path)
+        index.update(self.tests, self.fixtures)
+        index.save(self.path)
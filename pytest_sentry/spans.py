@@ -0,0 +1,145 @@
+import collections
+import time
+
+import pytest
+import sentry_sdk
+
+from .helpers import _session_start_key, _span_trees_key
+
+
+class SpanTree(object):
+    """
+    The spans of one isolation scope when `hierarchical_spans` is enabled:
+
+        pytest.session
+          pytest.module
+            pytest.class
+              pytest.runtest.protocol
+                pytest.runtest.setup/call/teardown
+                  pytest.fixture.setup/teardown
+
+    Every module is sent as its own transaction continuing the trace of the
+    session transaction, so that transactions stay small on large suites.
+    """
+
+    def __init__(self, isolation_scope, start_timestamp, trace_headers=None):
+        self.isolation_scope = isolation_scope
+
+        with sentry_sdk.continue_trace(trace_headers or {}):
+            self.session_span = sentry_sdk.start_span(
+                op="pytest.session",
+                name="pytest.session",
+                start_timestamp=start_timestamp,
+            )
+
+        self.module_node = self.module_span = None
+        self.class_node = self.class_span = None
+        self.phase_span = None
+        self.tests = 0
+
+        # How many tests used each fixture with a scope wider than "function"
+        # while it was set up.
+        self.fixture_uses = collections.Counter()
+        self._fixture_teardown_starts = {}
+
+    def enter_item(self, item, sample=None):
+        """
+        Starts the module and class spans for `item` if needed, and returns the
+        span the test span should be a child of. `sample` is called to get the
+        sampling decision for a new module transaction.
+        """
+        module_node = item.getparent(pytest.File) or item.parent
+        if module_node is not self.module_node:
+            self.finish_module()
+            with sentry_sdk.continue_trace(dict(self.session_span.iter_headers())):
+                self.module_span = sentry_sdk.start_span(
+                    op="pytest.module",
+                    name=module_node.nodeid,
+                    sampled=sample() if sample is not None else None,
+                )
+            self.module_node = module_node
+
+        class_node = item.getparent(pytest.Class)
+        if class_node is not self.class_node:
+            self.finish_class()
+            if class_node is not None:
+                self.class_span = self.module_span.start_child(
+                    op="pytest.class", name=class_node.nodeid
+                )
+            self.class_node = class_node
+
+        self.tests += 1
+        for fixturedefs in item._fixtureinfo.name2fixturedefs.values():
+            if fixturedefs and fixturedefs[-1].scope != "function":
+                self.fixture_uses[fixturedefs[-1]] += 1
+
+        return self.class_span or self.module_span
+
+    def leave_item(self, item, nextitem):
+        """
+        Finishes the class and module spans if `nextitem` is not part of them.
+        """
+        if nextitem is None or nextitem.getparent(pytest.Class) is not self.class_node:
+            self.finish_class()
+
+        if nextitem is None or (nextitem.getparent(pytest.File) or nextitem.parent) is not self.module_node:
+            self.finish_module()
+
+    def fixture_teardown_started(self, fixturedef):
+        self._fixture_teardown_starts[fixturedef] = time.time()
+
+    def fixture_teardown_finished(self, fixturedef):
+        start_timestamp = self._fixture_teardown_starts.pop(fixturedef, None)
+        parent_span = self.phase_span or self.module_span
+        if start_timestamp is None or parent_span is None:
+            return
+
+        span = parent_span.start_child(
+            op="pytest.fixture.teardown",
+            name="pytest.fixture.teardown {}".format(fixturedef.argname),
+            start_timestamp=start_timestamp,
+        )
+        span.set_attribute("pytest.fixture.scope", fixturedef.scope)
+        if fixturedef.scope != "function":
+            span.set_attribute("pytest-sentry.fixture.reuse_count", self.fixture_uses.pop(fixturedef, 0))
+        span.finish()
+
+    def finish_class(self):
+        if self.class_span is not None:
+            self.class_span.finish()
+        self.class_node = self.class_span = None
+
+    def finish_module(self):
+        self.finish_class()
+        if self.module_span is not None:
+            self.module_span.finish()
+        self.module_node = self.module_span = None
+
+    def finish(self):
+        with sentry_sdk.use_isolation_scope(self.isolation_scope):
+            self.finish_module()
+            self.session_span.set_attribute("pytest-sentry.tests", self.tests)
+            self.session_span.finish()
+
+
+def get_span_tree(config, isolation_scope, trace_headers=None):
+    """
+    Returns the span tree of `isolation_scope`, starting its session span on
+    first use.
+    """
+    trees = config.stash.setdefault(_span_trees_key, {})
+    try:
+        return trees[isolation_scope]
+    except KeyError:
+        tree = trees[isolation_scope] = SpanTree(
+            isolation_scope,
+            start_timestamp=config.stash.get(_session_start_key, None),
+            trace_headers=trace_headers,
+        )
+        return tree
+
+
+def finish_span_trees(config):
+    for tree in config.stash.get(_span_trees_key, {}).values():
+        tree.finish()
+    config.stash[_span_trees_key] = {}
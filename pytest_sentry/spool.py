@@ -0,0 +1,291 @@
+import glob
+import json
+import os
+import struct
+import threading
+import time
+
+import sentry_sdk
+from sentry_sdk.consts import DEFAULT_OPTIONS
+from sentry_sdk.envelope import Envelope
+from sentry_sdk.transport import HttpTransport
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_RECORD_HEADER = struct.Struct(">I")
+
+# Item types of which an envelope may only contain one, see
+# https://develop.sentry.dev/sdk/data-model/envelope-items/
+_EVENT_ITEM_TYPES = frozenset(["event", "transaction", "feedback", "user_report", "security", "raw_security"])
+
+# Envelope headers that differ between otherwise compatible envelopes.
+_PER_EVENT_HEADERS = ("event_id", "sent_at")
+
+
+class SpoolTransport(sentry_sdk.Transport):
+    """
+    A transport that appends envelopes to a segment file on disk instead of
+    sending them, for CI runners without network access. Upload the spooled
+    envelopes later with `python -m pytest_sentry upload-spool`.
+
+    Used by `Client` if `PYTEST_SENTRY_SPOOL_DIR` is set.
+    """
+
+    def __init__(self, options=None, spool_dir=None):
+        sentry_sdk.Transport.__init__(self, options)
+
+        if spool_dir is None:
+            spool_dir = os.environ["PYTEST_SENTRY_SPOOL_DIR"]
+
+        self.spool_dir = spool_dir
+        self.dsn = options["dsn"] if options else None
+        self._file = None
+        # Tests may report from several threads at once.
+        self._lock = threading.Lock()
+
+    def _open_segment(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        # Every process writes its own segment, so that eg. pytest-xdist
+        # workers do not need to coordinate.
+        path = os.path.join(
+            self.spool_dir, "{}-{}.segment".format(time.time_ns(), os.getpid())
+        )
+        f = open(path, "ab")
+        # Held until the segment is closed, so that uploads skip it.
+        _lock_segment(f)
+        _write_record(f, json.dumps({"dsn": self.dsn}).encode("utf-8"))
+        return f
+
+    def capture_envelope(self, envelope):
+        data = envelope.serialize()
+        with self._lock:
+            if self._file is None:
+                self._file = self._open_segment()
+
+            _write_record(self._file, data)
+            self._file.flush()
+
+    def flush(self, timeout, callback=None):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def kill(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _lock_segment(f):
+    """
+    Takes an exclusive lock on the segment file `f`. Returns `False` if
+    another process holds it.
+    """
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _write_record(f, data):
+    # A single write, so that a record is never split by a partial write.
+    f.write(_RECORD_HEADER.pack(len(data)) + data)
+
+
+def _read_records(f):
+    while True:
+        header = f.read(_RECORD_HEADER.size)
+        if len(header) < _RECORD_HEADER.size:
+            # A truncated record at the end is left over from a process that
+            # was killed while writing, and is dropped.
+            return
+        (length,) = _RECORD_HEADER.unpack(header)
+        data = f.read(length)
+        if len(data) < length:
+            return
+        yield data
+
+
+def _read_header(f):
+    return json.loads(next(_read_records(f), b"{}").decode("utf-8"))
+
+
+def _iter_segment(path):
+    """
+    Yields the envelopes spooled in the segment at `path`, one at a time.
+    """
+    with open(path, "rb") as f:
+        _read_header(f)
+        yield from _read_records(f)
+
+
+def _read_checkpoint(path):
+    try:
+        with open(path + ".offset") as f:
+            return int(f.read() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def _write_checkpoint(path, offset):
+    # Replaced atomically, so that a killed upload never leaves a truncated
+    # checkpoint behind.
+    with open(path + ".offset.tmp", "w") as f:
+        f.write(str(offset))
+    os.replace(path + ".offset.tmp", path + ".offset")
+
+
+def _merge_key(envelope):
+    headers = {key: value for key, value in envelope.headers.items() if key not in _PER_EVENT_HEADERS}
+    return json.dumps(headers, sort_keys=True, default=repr)
+
+
+def _has_event_item(envelope):
+    return any(item.type in _EVENT_ITEM_TYPES for item in envelope.items)
+
+
+def _merge_records(f, max_bytes):
+    """
+    Reads the envelopes from `f` and merges consecutive ones with the same
+    headers, as long as the result contains at most one event or
+    transaction and stays below `max_bytes`. Yields (envelope, number of
+    merged envelopes, offset after the last one) tuples. Only consecutive
+    envelopes are merged, so that the offset marks exactly what was sent.
+    """
+    entry = None
+    for data in _read_records(f):
+        offset = f.tell()
+        envelope = Envelope.deserialize(data)
+        key = _merge_key(envelope)
+        has_event = _has_event_item(envelope)
+
+        if (
+            entry is not None
+            and entry["key"] == key
+            and not (has_event and entry["has_event"])
+            and entry["size"] + len(data) <= max_bytes
+        ):
+            entry["envelope"].items.extend(envelope.items)
+            if has_event:
+                entry["envelope"].headers.update(envelope.headers)
+                entry["has_event"] = True
+            entry["size"] += len(data)
+            entry["count"] += 1
+            entry["offset"] = offset
+            continue
+
+        if entry is not None:
+            yield entry["envelope"], entry["count"], entry["offset"]
+        entry = {
+            "envelope": envelope,
+            "key": key,
+            "has_event": has_event,
+            "size": len(data),
+            "count": 1,
+            "offset": offset,
+        }
+
+    if entry is not None:
+        yield entry["envelope"], entry["count"], entry["offset"]
+
+
+class _UploadTransport(HttpTransport):
+    """
+    The SDK's HTTP transport, sending envelopes synchronously so that the
+    upload knows which ones were delivered. Like for any client, proxies,
+    CA bundles and client certificates are taken from the options or the
+    environment, and requests are compressed and rate limits honored.
+    """
+
+    def __init__(self, options, timeout):
+        self.TIMEOUT = timeout
+        HttpTransport.__init__(self, options)
+        self._delivered = False
+
+    def _handle_response(self, response, envelope):
+        self._delivered = 200 <= response.status < 300
+        HttpTransport._handle_response(self, response, envelope)
+
+    def send(self, envelope):
+        """
+        Sends `envelope` and returns whether it was delivered. Envelopes of
+        a rate limited category are not sent at all.
+        """
+        self._delivered = False
+        try:
+            self._send_envelope(envelope)
+        except Exception:
+            return False
+        return self._delivered
+
+
+def _count_records(f):
+    return sum(1 for _ in _read_records(f))
+
+
+def upload_spool(spool_dir, dsn=None, timeout=30, max_bytes=1024 * 1024, options=None):
+    """
+    Uploads all spooled envelopes in `spool_dir`, oldest segment first, and
+    deletes segments once all their envelopes are delivered. Segments that a
+    running test session is still writing are skipped.
+
+    Segments are read one envelope at a time. Consecutive envelopes are
+    merged into requests of up to `max_bytes` where the envelope protocol
+    allows it, and sent with the SDK's HTTP transport, configured by the
+    client `options`, like `https_proxy` or `ca_certs`. Envelopes for the
+    same DSN share one connection pool. The byte offset of the next envelope to send is saved
+    after every delivered request, so an interrupted upload resumes without
+    sending delivered envelopes again. Uploading stops at the first request
+    that is rejected or fails to send.
+
+    Returns a tuple of (uploaded, remaining) envelope counts.
+    """
+    transports = {}
+    uploaded = remaining = 0
+
+    for path in sorted(glob.glob(os.path.join(spool_dir, "*.segment"))):
+        with open(path, "rb") as f:
+            header = _read_header(f)
+            if not _lock_segment(f):
+                remaining += _count_records(f)
+                continue
+
+            offset = _read_checkpoint(path) or f.tell()
+            f.seek(offset)
+            segment_dsn = dsn or header.get("dsn")
+
+            if remaining or not segment_dsn:
+                remaining += _count_records(f)
+                continue
+
+            if segment_dsn not in transports:
+                transports[segment_dsn] = _UploadTransport(
+                    dict(DEFAULT_OPTIONS, **dict(options or {}, dsn=segment_dsn)), timeout
+                )
+
+            failed = False
+            for envelope, count, end in _merge_records(f, max_bytes):
+                if not transports[segment_dsn].send(envelope):
+                    failed = True
+                    break
+                uploaded += count
+                offset = end
+                _write_checkpoint(path, offset)
+
+            if failed:
+                f.seek(offset)
+                remaining += _count_records(f)
+                continue
+
+        os.remove(path)
+        if os.path.exists(path + ".offset"):
+            os.remove(path + ".offset")
+
+    return uploaded, remaining
@@ -0,0 +1,127 @@
+import concurrent.futures
+import concurrent.futures.thread
+import contextvars
+import functools
+import threading
+import time
+import types
+
+
+# At most this many threads and executor tasks are reported as spans per test.
+_MAX_THREAD_SPANS = 100
+
+# Background threads of the SDK and this plugin keep running after the test.
+_IGNORED_THREAD_PREFIXES = ("sentry-sdk.", "pytest-sentry.")
+
+_active_monitor = contextvars.ContextVar("pytest_sentry_thread_monitor", default=None)
+_original_thread_start = None
+_original_submit = None
+
+
+class ThreadMonitor(object):
+    """
+    Runs threads started and `ThreadPoolExecutor` tasks submitted between
+    `start` and `stop` in a copy of the context they were started from, so
+    that they use the test's isolation scope and continue its trace. This
+    applies to threads started by those threads as well.
+
+    Also times how long every thread and task ran, and how much CPU time it
+    used.
+    """
+
+    def __init__(self):
+        self.threads = 0
+        self.tasks = 0
+        self.busy = 0.0
+        self.cpu = 0.0
+        self.runs = []
+        self._lock = threading.Lock()
+        self._token = None
+
+    def _run(self, op, name, context, fn, *args, **kwargs):
+        start_timestamp = time.time()
+        start = time.perf_counter()
+        start_cpu = time.thread_time()
+        try:
+            return context.run(fn, *args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            cpu = time.thread_time() - start_cpu
+            with self._lock:
+                self.busy += duration
+                self.cpu += cpu
+                self.runs.append((op, name, start_timestamp, duration, cpu))
+
+    def _start_thread(self, thread):
+        if (
+            _active_monitor.get() is self
+            and not thread.name.startswith(_IGNORED_THREAD_PREFIXES)
+            # Executor workers are long-lived, their tasks are timed instead.
+            and getattr(thread, "_target", None) is not concurrent.futures.thread._worker
+        ):
+            with self._lock:
+                self.threads += 1
+            context = contextvars.copy_context()
+            original_run = thread.run
+
+            def run(thread):
+                return self._run("thread", thread.name, context, original_run)
+
+            # A bound method, as the SDK's threading integration wraps the
+            # function behind it.
+            thread.run = types.MethodType(run, thread)
+        return _original_thread_start(thread)
+
+    def _submit(self, executor, fn, *args, **kwargs):
+        if _active_monitor.get() is self:
+            with self._lock:
+                self.tasks += 1
+            name = getattr(fn, "__qualname__", None) or repr(fn)
+            fn = functools.partial(self._run, "thread.task", name, contextvars.copy_context(), fn)
+        return _original_submit(executor, fn, *args, **kwargs)
+
+    def start(self):
+        global _original_thread_start, _original_submit
+
+        if _original_thread_start is not None:
+            raise RuntimeError("Another ThreadMonitor is already running")
+
+        self._token = _active_monitor.set(self)
+        _original_thread_start = threading.Thread.start
+        _original_submit = concurrent.futures.ThreadPoolExecutor.submit
+        threading.Thread.start = lambda thread: self._start_thread(thread)
+        concurrent.futures.ThreadPoolExecutor.submit = (
+            lambda executor, fn, /, *args, **kwargs: self._submit(executor, fn, *args, **kwargs)
+        )
+
+    def stop(self):
+        global _original_thread_start, _original_submit
+
+        threading.Thread.start = _original_thread_start
+        concurrent.futures.ThreadPoolExecutor.submit = _original_submit
+        _original_thread_start = _original_submit = None
+        _active_monitor.reset(self._token)
+
+    def report(self, span):
+        """
+        Sets the measurements as attributes of `span`, and adds a `thread` or
+        `thread.task` child span for every thread and task that finished.
+        """
+        with self._lock:
+            runs = list(self.runs)
+            span.set_attribute("pytest-sentry.threads.started", self.threads)
+            span.set_attribute("pytest-sentry.threads.tasks", self.tasks)
+            span.set_attribute("pytest-sentry.threads.busy", self.busy)
+            span.set_attribute("pytest-sentry.threads.cpu", self.cpu)
+
+        for op, name, start_timestamp, duration, cpu in sorted(runs, key=lambda run: -run[3])[:_MAX_THREAD_SPANS]:
+            child = span.start_child(op=op, name=name, start_timestamp=start_timestamp)
+            child.set_attribute("pytest-sentry.cpu", cpu)
+            child.finish(end_timestamp=start_timestamp + duration)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,115 @@
+import json
+
+import pytest
+from pytest_sentry.spool import _iter_segment
+
+from sentry_sdk.envelope import Envelope
+
+pytest_plugins = ["pytester"]
+
+
+# Written as the `conftest.py` of the tests that `pytester` runs, so they
+# report to a client that writes their events and transactions to a file.
+CONFTEST = """
+import json
+
+import pytest
+import pytest_sentry
+from pytest_sentry.integration import PytestIntegration
+import sentry_sdk
+
+
+class FileTransport(sentry_sdk.Transport):
+    def __init__(self):
+        pass
+
+    def capture_envelope(self, envelope):
+        event = envelope.get_transaction_event() or envelope.get_event()
+        if event is not None:
+            with open({path!r}, "a") as f:
+                f.write(json.dumps(event) + "\\n")
+
+
+SENTRY_CLIENT = pytest.mark.sentry_client(
+    pytest_sentry.Client(
+        transport=FileTransport(),
+        integrations=[PytestIntegration(**{integration_options!r})],
+    )
+)
+
+
+def pytest_itemcollected(item):
+    item.add_marker(SENTRY_CLIENT)
+"""
+
+
+class SentryEvents(object):
+    """
+    The events and transactions reported by the tests that `pytester` runs.
+    """
+
+    def __init__(self, pytester):
+        self._pytester = pytester
+        self.path = pytester.path / "events.jsonl"
+
+    def configure(self, **integration_options):
+        """
+        Reports the tests to a client with a `PytestIntegration` created with
+        the given options.
+        """
+        self._pytester.makeconftest(
+            CONFTEST.format(path=str(self.path), integration_options=integration_options)
+        )
+
+    def read(self):
+        if not self.path.exists():
+            return []
+        return [json.loads(line) for line in self.path.read_text().splitlines()]
+
+    def transactions(self):
+        return [event for event in self.read() if event.get("type") == "transaction"]
+
+    def errors(self):
+        return [event for event in self.read() if event.get("type") != "transaction"]
+
+    def clear(self):
+        if self.path.exists():
+            self.path.unlink()
+
+
+@pytest.fixture
+def sentry_events(pytester):
+    rv = SentryEvents(pytester)
+    rv.configure()
+    return rv
+
+
+class SentrySpool(object):
+    """
+    The envelopes that the tests that `pytester` runs write to the spool
+    directory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        return [
+            Envelope.deserialize(data)
+            for segment in sorted(self.path.glob("*.segment"))
+            for data in _iter_segment(str(segment))
+        ]
+
+    def transactions(self):
+        return [
+            envelope.get_transaction_event()
+            for envelope in self.read()
+            if envelope.get_transaction_event() is not None
+        ]
+
+
+@pytest.fixture
+def sentry_spool(tmp_path, monkeypatch):
+    rv = SentrySpool(tmp_path / "spool")
+    monkeypatch.setenv("PYTEST_SENTRY_SPOOL_DIR", str(rv.path))
+    return rv
@@ -0,0 +1,111 @@
+import json
+
+import pytest
+from pytest_sentry.aggregate import SessionAggregate, _TOP_ENTRIES
+
+
+TEST_MODULE = """
+import time
+
+import pytest
+
+
+@pytest.fixture
+def slow_fixture():
+    time.sleep(0.05)
+
+
+def test_fast(slow_fixture):
+    pass
+
+
+def test_slow():
+    time.sleep(0.2)
+
+
+def test_fail():
+    assert False
+
+
+@pytest.mark.skip
+def test_skipped():
+    pass
+"""
+
+
+def test_aggregate_only(pytester, monkeypatch, sentry_spool):
+    pytester.makepyfile(test_aggregated=TEST_MODULE)
+    monkeypatch.setenv("PYTEST_SENTRY_DSN", "https://key@sentry.invalid/1")
+    monkeypatch.setenv("PYTEST_SENTRY_AGGREGATE_ONLY", "1")
+    monkeypatch.setenv("PYTEST_SENTRY_OUTLIER_DURATION", "0.1")
+
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider")
+    result.assert_outcomes(passed=2, failed=1, skipped=1)
+
+    transactions = [t for t in sentry_spool.transactions() if t["transaction"] != "pytest.collection"]
+
+    # Only the outlier and the failure are sent individually
+    reasons = {
+        t["transaction"]: t["contexts"]["trace"]["data"]["pytest-sentry.aggregate.reason"]
+        for t in transactions
+        if t["transaction"] != "pytest.session.summary"
+    }
+    assert reasons == {
+        "pytest.runtest.call test_aggregated.py::test_slow": "outlier",
+        "pytest.runtest.call test_aggregated.py::test_fail": "failure",
+    }
+
+    (summary_transaction,) = [t for t in transactions if t["transaction"] == "pytest.session.summary"]
+    data = summary_transaction["contexts"]["trace"]["data"]
+    assert data["pytest-sentry.tests"] == 3
+    assert data["pytest-sentry.tests.passed"] == 2
+    assert data["pytest-sentry.tests.failed"] == 1
+    assert data["pytest-sentry.tests.skipped"] == 1
+
+    summary = json.loads(data["sentry.context.pytest_sentry.summary"])
+    assert summary["outcomes"] == {"test_aggregated.py": {"passed": 2, "failed": 1, "skipped": 1}}
+    assert summary["tests"]["count"] == 3
+    assert summary["tests"]["max"] >= 0.2
+    assert summary["slowest_tests"][0]["nodeid"] == "test_aggregated.py::test_slow"
+    assert summary["modules"]["test_aggregated.py"]["count"] == 3
+    assert summary["fixtures"]["slow_fixture"]["p50"] >= 0.05
+
+
+def test_aggregate_only_xdist(pytester, monkeypatch, sentry_spool):
+    pytest.importorskip("xdist")
+
+    pytester.makepyfile(
+        test_one="def test_a():\n    pass\n\ndef test_b():\n    pass\n",
+        test_two="def test_c():\n    pass\n\ndef test_d():\n    pass\n",
+    )
+    monkeypatch.setenv("PYTEST_SENTRY_DSN", "https://key@sentry.invalid/1")
+    monkeypatch.setenv("PYTEST_SENTRY_AGGREGATE_ONLY", "1")
+
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider", "-n", "2", "--dist", "loadfile")
+    result.assert_outcomes(passed=4)
+
+    # One summary per worker, none from the controller.
+    summaries = [t for t in sentry_spool.transactions() if t["transaction"] == "pytest.session.summary"]
+    assert sorted(t["tags"]["pytest.xdist.worker"] for t in summaries) == ["gw0", "gw1"]
+    assert sum(t["contexts"]["trace"]["data"]["pytest-sentry.tests"] for t in summaries) == 4
+
+
+def test_summary_is_capped():
+    aggregate = SessionAggregate()
+    for i in range(_TOP_ENTRIES + 10):
+        module = "test_{}.py".format(i)
+        aggregate.add_outcome(module, "passed")
+        aggregate.add_test(module, module + "::test", float(i))
+        aggregate.add_fixture("fixture_{}".format(i), float(i))
+    aggregate.add_outcome("test_skipped.py", "skipped")
+
+    summary = aggregate.summary()
+    assert len(summary["outcomes"]) == len(summary["modules"]) == _TOP_ENTRIES
+    assert len(summary["fixtures"]) == _TOP_ENTRIES
+    assert summary["module_count"] == _TOP_ENTRIES + 11
+    assert summary["fixture_count"] == _TOP_ENTRIES + 10
+    # The modules and fixtures that took longest are kept.
+    assert "test_{}.py".format(_TOP_ENTRIES + 9) in summary["modules"]
+    assert "test_0.py" not in summary["modules"]
+    assert "test_skipped.py" not in summary["outcomes"]
+    assert "fixture_0" not in summary["fixtures"]
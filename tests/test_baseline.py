@@ -0,0 +1,57 @@
+from pytest_sentry.baseline import DurationBaseline
+
+
+TEST_MODULE = """
+import time
+
+
+def test_slow():
+    time.sleep(0.3)
+
+
+def test_fast():
+    pass
+"""
+
+
+def test_baseline_window(tmp_path):
+    baseline = DurationBaseline(str(tmp_path / "baseline.db"), window=3)
+    for duration in [1.0, 2.0, 3.0, 4.0]:
+        baseline.record("test_a", "call", duration)
+    baseline.save()
+
+    baseline = DurationBaseline(str(tmp_path / "baseline.db"))
+    assert list(baseline.load()["test_a", "call"]) == [2.0, 3.0, 4.0]
+    # Too few durations to compare against
+    assert baseline.stats("test_a", "call") is None
+
+
+def test_slow_test_regression(pytester, monkeypatch, sentry_events):
+    baseline_path = str(pytester.path / "baseline.db")
+
+    baseline = DurationBaseline(baseline_path)
+    for _ in range(5):
+        baseline.record("test_slow_test_regression.py::test_slow", "call", 0.01)
+        baseline.record("test_slow_test_regression.py::test_fast", "call", 0.01)
+    baseline.save()
+
+    pytester.makepyfile(TEST_MODULE)
+    monkeypatch.setenv("PYTEST_SENTRY_BASELINE_PATH", baseline_path)
+    monkeypatch.delenv("PYTEST_SENTRY_ALWAYS_REPORT", raising=False)
+
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider")
+    result.assert_outcomes(passed=2)
+    result.stdout.fnmatch_lines([
+        "pytest-sentry: 1 slow test regressions",
+        "  test_slow_test_regression.py::test_slow (call): 0.3*s, median 0.01s",
+    ])
+
+    (event,) = sentry_events.errors()
+    assert event["level"] == "warning"
+    assert event["fingerprint"] == ["pytest-sentry-slow-test", "test_slow_test_regression.py::test_slow", "call"]
+    assert event["contexts"]["pytest_sentry.regression"]["median"] == 0.01
+    assert len(event["contexts"]["trace"]["trace_id"]) == 32
+
+    baseline = DurationBaseline(baseline_path)
+    assert len(baseline.load()["test_slow_test_regression.py::test_slow", "call"]) == 6
+    assert len(baseline.load()["test_slow_test_regression.py::test_slow", "setup"]) == 1
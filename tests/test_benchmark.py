@@ -0,0 +1,76 @@
+import pytest
+
+
+TEST_MODULE = """
+import os
+import time
+
+
+def test_sleep(benchmark):
+    benchmark.pedantic(time.sleep, args=(float(os.environ["SLEEP"]),), rounds=3)
+
+
+def test_no_benchmark():
+    pass
+"""
+
+
+def _run(pytester, monkeypatch, sentry_events, sleep):
+    sentry_events.clear()
+    monkeypatch.setenv("SLEEP", str(sleep))
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider")
+    result.assert_outcomes(passed=2)
+    return result
+
+
+def test_benchmark_regression(pytester, monkeypatch, sentry_events):
+    pytest.importorskip("pytest_benchmark")
+
+    pytester.makepyfile(TEST_MODULE)
+    monkeypatch.setenv("PYTEST_SENTRY_BASELINE_PATH", str(pytester.path / "baseline.db"))
+
+    _run(pytester, monkeypatch, sentry_events, 0.001)
+    calls = {
+        t["transaction"]: t
+        for t in sentry_events.transactions()
+        if t["transaction"].startswith("pytest.runtest.call")
+    }
+
+    data = calls["pytest.runtest.call test_benchmark_regression.py::test_sleep"]["contexts"]["trace"]["data"]
+    assert data["pytest-sentry.benchmark.rounds"] == 3
+    assert data["pytest-sentry.benchmark.min"] >= 0.001
+    assert data["pytest-sentry.benchmark.ops"] <= 1000
+    for stat in ["median", "stddev", "mean", "max", "iqr"]:
+        assert "pytest-sentry.benchmark.{}".format(stat) in data
+    data = calls["pytest.runtest.call test_benchmark_regression.py::test_no_benchmark"]["contexts"]["trace"]["data"]
+    assert "pytest-sentry.benchmark.median" not in data
+    assert not sentry_events.errors()
+
+    result = _run(pytester, monkeypatch, sentry_events, 0.01)
+    result.stdout.fnmatch_lines([
+        "pytest-sentry: 1 slow benchmark regressions",
+        "  test_benchmark_regression.py::test_sleep: median 0.01*s, previously 0.001*s",
+    ])
+    (event,) = sentry_events.errors()
+    assert event["message"].startswith("Slow benchmark: test_benchmark_regression.py::test_sleep")
+    assert event["level"] == "warning"
+    (call,) = [t for t in sentry_events.transactions() if t["transaction"].endswith("::test_sleep")]
+    assert event["contexts"]["trace"]["trace_id"] == call["contexts"]["trace"]["trace_id"]
+    assert event["contexts"]["pytest_sentry.benchmark"]["previous_stats"]["rounds"] == 3
+
+
+def test_benchmark_regression_aggregate_only(pytester, monkeypatch, sentry_events):
+    pytest.importorskip("pytest_benchmark")
+
+    pytester.makepyfile(TEST_MODULE)
+    monkeypatch.setenv("PYTEST_SENTRY_BASELINE_PATH", str(pytester.path / "baseline.db"))
+    monkeypatch.setenv("PYTEST_SENTRY_AGGREGATE_ONLY", "1")
+    monkeypatch.setenv("PYTEST_SENTRY_OUTLIER_DURATION", "60")
+
+    _run(pytester, monkeypatch, sentry_events, 0.001)
+    result = _run(pytester, monkeypatch, sentry_events, 0.01)
+
+    result.stdout.fnmatch_lines(["pytest-sentry: 1 slow benchmark regressions"])
+    (event,) = sentry_events.errors()
+    assert event["message"].startswith("Slow benchmark: test_benchmark_regression_aggregate_only.py::test_sleep")
+    assert [t["transaction"] for t in sentry_events.transactions()] == ["pytest.session.summary"]
@@ -0,0 +1,49 @@
+import pytest
+
+from pytest_sentry import helpers
+
+
+DSN = "https://key@sentry.invalid/1"
+
+
+@pytest.fixture
+def client_pool(monkeypatch):
+    monkeypatch.setattr(helpers, "_client_pool", {})
+    monkeypatch.setattr(helpers, "_released_clients", [])
+    yield helpers._client_pool
+    helpers._close_pooled_clients()
+
+
+def test_shared_client(client_pool):
+    a = pytest.mark.sentry_client(DSN).mark
+    b = pytest.mark.sentry_client(DSN + " ").mark
+    c = pytest.mark.sentry_client({"dsn": DSN}).mark
+    d = pytest.mark.sentry_client({"dsn": DSN, "traces_sample_rate": 0.0}).mark
+
+    scope_a, scope_b, scope_c, scope_d = [helpers._resolve_scope_marker_value(marker) for marker in (a, b, c, d)]
+
+    assert scope_a is not scope_b
+    assert scope_a.client is scope_b.client is scope_c.client
+    assert scope_d.client is not scope_a.client
+    assert sorted(refcount for _, refcount in client_pool.values()) == [1, 3]
+
+
+def test_release_on_eviction(client_pool, monkeypatch):
+    monkeypatch.setattr(helpers, "_ISOLATION_SCOPE_CACHE_MAXSIZE", 1)
+    scope = helpers._resolve_scope_marker_value(pytest.mark.sentry_client(DSN).mark)
+    helpers._resolve_scope_marker_value(pytest.mark.sentry_client({"dsn": DSN, "debug": False}).mark)
+
+    assert scope.client not in [entry[0] for entry in client_pool.values()]
+    assert helpers._released_clients == [scope.client]
+    # Tests may still use the client until the end of the session
+    assert scope.client.transport is not None
+
+
+def test_close(client_pool):
+    marker = pytest.mark.sentry_client(DSN).mark
+    scope = helpers._resolve_scope_marker_value(marker)
+
+    assert helpers._close_pooled_clients() == 1
+    assert scope.client.transport is None
+    assert not client_pool
+    assert id(marker) not in helpers._isolation_scope_cache
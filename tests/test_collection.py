@@ -0,0 +1,85 @@
+import datetime
+
+import pytest
+
+from pytest_sentry.hooks import _parse_collection_report
+
+
+def _duration(span):
+    start, end = (
+        datetime.datetime.fromisoformat(span[key].replace("Z", "+00:00"))
+        for key in ("start_timestamp", "timestamp")
+    )
+    return (end - start).total_seconds()
+
+
+def test_collection_spans(pytester, monkeypatch, sentry_spool):
+    pytester.makeconftest("import time\ntime.sleep(0.05)\n")
+    pytester.makepyfile(
+        test_slow="import time\ntime.sleep(0.2)\n\ndef test_slow():\n    pass\n",
+        test_fast="def test_fast():\n    pass\n",
+    )
+    monkeypatch.setenv("PYTEST_SENTRY_DSN", "https://key@sentry.invalid/1")
+    monkeypatch.setenv("PYTEST_SENTRY_COLLECTION_REPORT", "1")
+    monkeypatch.setenv("PYTEST_SENTRY_COLLECTION_REPORT_TOP", "5")
+
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider")
+    result.assert_outcomes(passed=2)
+    result.stdout.fnmatch_lines([
+        "pytest-sentry: slowest modules to collect",
+        "     0.2*s  test_slow.py",
+        "     0.0*s  test_fast.py",
+    ])
+
+    (collection,) = [t for t in sentry_spool.transactions() if t["transaction"] == "pytest.collection"]
+    assert collection["contexts"]["trace"]["data"]["pytest-sentry.collected"] == 2
+
+    spans = {span["description"]: span for span in collection["spans"]}
+    assert spans["pytest.load_initial_conftests"]["op"] == "pytest.load_initial_conftests"
+    assert spans["test_slow.py"]["op"] == "pytest.collect.module"
+    assert _duration(spans["test_slow.py"]) >= 0.2
+    assert spans["test_fast.py"]["op"] == "pytest.collect.module"
+    assert spans["."]["op"] == "pytest.collect.directory"
+
+
+@pytest.mark.parametrize(
+    "enabled, top, expected",
+    [
+        ("1", None, 10),
+        ("yes", "", 10),
+        ("True", "5", 5),
+        ("1", "1", 1),
+        ("5", None, 0),
+        ("0", "5", 0),
+        ("no", None, 0),
+        ("", None, 0),
+        (None, "5", 0),
+    ],
+)
+def test_parse_collection_report(enabled, top, expected):
+    assert _parse_collection_report(enabled, top) == expected
+
+
+def test_collection_report_without_dsn(pytester, monkeypatch):
+    pytester.makepyfile(test_fast="def test_fast():\n    pass\n")
+    monkeypatch.delenv("PYTEST_SENTRY_DSN", raising=False)
+    monkeypatch.delenv("SENTRY_DSN", raising=False)
+    monkeypatch.setenv("PYTEST_SENTRY_COLLECTION_REPORT", "yes")
+
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider")
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(["pytest-sentry: slowest modules to collect", "     0.0*s  test_fast.py"])
+
+
+def test_collection_xdist(pytester, monkeypatch, sentry_spool):
+    pytest.importorskip("xdist")
+
+    pytester.makepyfile(test_fast="def test_fast():\n    pass\n\ndef test_other():\n    pass\n")
+    monkeypatch.setenv("PYTEST_SENTRY_DSN", "https://key@sentry.invalid/1")
+
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider", "-n", "2")
+    result.assert_outcomes(passed=2)
+
+    # One per worker, none from the controller.
+    collections = [t for t in sentry_spool.transactions() if t["transaction"] == "pytest.collection"]
+    assert [t["contexts"]["trace"]["data"]["pytest-sentry.collected"] for t in collections] == [2, 2]
@@ -11,8 +11,12 @@ envelopes = []
 @pytest.fixture(autouse=True)
 def clear_events(monkeypatch):
     monkeypatch.setenv("GITHUB_RUN_ID", "123abc")
+    pytest_sentry.get_environ_tags(refresh=True)
     events.clear()
     envelopes.clear()
+    yield
+    monkeypatch.undo()
+    pytest_sentry.get_environ_tags(refresh=True)
 
 
 class MyTransport(sentry_sdk.Transport):
@@ -49,3 +53,12 @@ def test_transaction(request):
                 ]
                 == "123abc"
             )
+
+
+def test_scope_tags(sentry_test_scope):
+    with sentry_sdk.use_isolation_scope(sentry_test_scope):
+        sentry_sdk.set_tags(pytest_sentry.get_environ_tags())
+        sentry_test_scope.capture_message("hi")
+
+    (event,) = events
+    assert event["tags"]["pytest_environ.GITHUB_RUN_ID"] == "123abc"
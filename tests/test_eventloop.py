@@ -0,0 +1,67 @@
+import asyncio
+import contextvars
+
+import pytest
+from pytest_sentry.eventloop import EventLoopMonitor
+
+
+TEST_MODULE = """
+import asyncio
+import time
+
+import pytest
+import sentry_sdk
+
+
+async def blocking():
+    with sentry_sdk.start_span(op="test.blocking", name="blocking"):
+        time.sleep(0.1)
+
+
+@pytest.mark.asyncio
+async def test_blocking():
+    await asyncio.sleep(0.01)
+    await asyncio.create_task(blocking())
+"""
+
+
+def test_slow_callbacks(pytester, sentry_events):
+    pytest.importorskip("pytest_asyncio")
+
+    sentry_events.configure(slow_callback_duration=0.05)
+    pytester.makepyfile(TEST_MODULE)
+
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider")
+    result.assert_outcomes(passed=1)
+
+    transactions = sentry_events.transactions()
+    (call,) = [t for t in transactions if t["transaction"].startswith("pytest.runtest.call")]
+
+    data = call["contexts"]["trace"]["data"]
+    assert data["pytest-sentry.asyncio.callbacks"] >= 3
+    assert data["pytest-sentry.asyncio.busy"] >= 0.1
+    assert data["pytest-sentry.asyncio.slow_callbacks"] == 1
+
+    spans = {span["op"]: span for span in call["spans"]}
+    assert "blocking()" in spans["asyncio.callback"]["description"]
+    # The span started in the task is part of the test's transaction.
+    assert spans["test.blocking"]["parent_span_id"] == call["contexts"]["trace"]["span_id"]
+
+
+def test_restores_propagated_contexts():
+    var = contextvars.ContextVar("var", default=None)
+    # Like the context an `asyncio.Runner` runs all of its tasks in.
+    context = contextvars.copy_context()
+    seen = []
+
+    loop = asyncio.new_event_loop()
+    try:
+        with EventLoopMonitor(1.0, propagate=lambda: var.set("test"), restore=var.reset):
+            loop.call_soon(lambda: seen.append(var.get()), context=context)
+            loop.call_soon(loop.stop)
+            loop.run_forever()
+    finally:
+        loop.close()
+
+    assert seen == ["test"]
+    assert context.run(var.get) is None
@@ -0,0 +1,42 @@
+TEST_MODULE = """
+import pytest
+
+
+def broken_helper():
+    raise RuntimeError("broken")
+
+
+@pytest.mark.parametrize("i", range(5))
+def test_broken(i):
+    broken_helper()
+
+
+def test_other():
+    assert False
+"""
+
+
+def test_failure_deduplication(pytester, sentry_events):
+    sentry_events.configure(always_report=True, max_events_per_failure=2)
+    pytester.makepyfile(TEST_MODULE)
+
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider")
+    result.assert_outcomes(failed=6)
+
+    events = sentry_events.errors()
+    exception_types = [event["exception"]["values"][-1]["type"] for event in events if "exception" in event]
+    assert sorted(exception_types) == ["AssertionError", "RuntimeError", "RuntimeError"]
+
+    (aggregated,) = [event for event in events if "exception" not in event]
+    failures = aggregated["contexts"]["pytest_sentry.failures"]
+    assert failures["exception_type"] == "builtins.RuntimeError"
+    assert failures["location"] == "test_failure_deduplication.py:5 in broken_helper"
+    assert failures["count"] == 5
+    assert failures["reported"] == 2
+    assert failures["nodeids"] == [
+        "test_failure_deduplication.py::test_broken[{}]".format(i) for i in range(5)
+    ]
+    assert aggregated["message"] == (
+        "builtins.RuntimeError failed 5 tests at test_failure_deduplication.py:5 in broken_helper "
+        "(2 reported individually)"
+    )
@@ -0,0 +1,74 @@
+import queue
+
+import pytest_sentry
+from pytest_sentry import helpers
+
+import sentry_sdk
+
+
+class SlowTransport(sentry_sdk.Transport):
+    """
+    A transport whose queue never drains, like one talking to an
+    unresponsive ingest endpoint.
+    """
+
+    def __init__(self):
+        self._worker = self
+        self._queue = queue.Queue()
+        self.flush_timeouts = []
+
+    def capture_envelope(self, envelope):
+        self._queue.put(envelope)
+
+    def flush(self, timeout, callback=None):
+        self.flush_timeouts.append(timeout)
+
+
+def test_flush_budget(monkeypatch):
+    transport = SlowTransport()
+    client = pytest_sentry.Client(transport=transport)
+    monkeypatch.setattr(helpers, "_reporting_clients", [client])
+
+    scope = sentry_sdk.Scope()
+    scope.set_client(client)
+    with sentry_sdk.use_isolation_scope(scope):
+        sentry_sdk.capture_message("hi")
+        sentry_sdk.capture_message("hi")
+
+    stats = helpers._flush_clients(timeout=0.5)
+
+    assert stats["clients"] == 1
+    assert stats["captured"] == 2
+    assert stats["dropped"] == 2
+    (timeout,) = transport.flush_timeouts
+    assert 0 < timeout <= 0.5
+
+
+class RejectingTransport(sentry_sdk.Transport):
+    """
+    A transport whose requests all fail, like the SDK's HTTP transport on
+    network errors or 5xx responses.
+    """
+
+    def capture_envelope(self, envelope):
+        for item in envelope.items:
+            self.record_lost_event("network_error", item=item)
+
+    def flush(self, timeout, callback=None):
+        pass
+
+
+def test_flush_counts_transport_drops(monkeypatch):
+    client = pytest_sentry.Client(transport=RejectingTransport())
+    monkeypatch.setattr(helpers, "_reporting_clients", [client])
+
+    scope = sentry_sdk.Scope()
+    scope.set_client(client)
+    with sentry_sdk.use_isolation_scope(scope):
+        sentry_sdk.capture_message("hi")
+        sentry_sdk.capture_message("hi")
+
+    stats = helpers._flush_clients(timeout=0.5)
+
+    assert stats["captured"] == 2
+    assert stats["dropped"] == 2
@@ -0,0 +1,57 @@
+TEST_MODULE = """
+import pytest
+
+
+@pytest.fixture(scope="module")
+def expensive():
+    yield 42
+
+
+def test_one(expensive):
+    pass
+
+
+def test_two(expensive):
+    pass
+
+
+class TestClass:
+    def test_three(self):
+        pass
+"""
+
+
+def test_hierarchical_spans(pytester, sentry_events):
+    sentry_events.configure(hierarchical_spans=True)
+    pytester.makepyfile(TEST_MODULE)
+
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider")
+    result.assert_outcomes(passed=3)
+
+    module_transaction, session_transaction = sentry_events.transactions()
+
+    assert session_transaction["transaction"] == "pytest.session"
+    assert module_transaction["transaction"] == "test_hierarchical_spans.py"
+    assert (
+        module_transaction["contexts"]["trace"]["trace_id"]
+        == session_transaction["contexts"]["trace"]["trace_id"]
+    )
+    assert (
+        module_transaction["contexts"]["trace"]["parent_span_id"]
+        == session_transaction["contexts"]["trace"]["span_id"]
+    )
+
+    spans = {span["span_id"]: span for span in module_transaction["spans"]}
+    by_description = {span["description"]: span for span in spans.values()}
+
+    test_span = by_description["pytest.runtest.protocol test_hierarchical_spans.py::test_one"]
+    call_span = by_description["pytest.runtest.call test_hierarchical_spans.py::test_one"]
+    setup_span = by_description["pytest.runtest.setup test_hierarchical_spans.py::test_one"]
+    assert call_span["parent_span_id"] == test_span["span_id"]
+    assert by_description["pytest.fixture.setup expensive"]["parent_span_id"] == setup_span["span_id"]
+
+    class_span = by_description["test_hierarchical_spans.py::TestClass"]
+    assert by_description["pytest.runtest.protocol test_hierarchical_spans.py::TestClass::test_three"]["parent_span_id"] == class_span["span_id"]
+
+    teardown = by_description["pytest.fixture.teardown expensive"]
+    assert teardown["data"]["pytest-sentry.fixture.reuse_count"] == 2
@@ -0,0 +1,37 @@
+from pytest_sentry.integration import PytestIntegration, _process_stacktrace
+
+
+def _frames(*modules):
+    return {"frames": [{"module": module, "abs_path": "/src/x.py"} for module in modules]}
+
+
+def test_default():
+    stacktrace = _frames("_pytest.runner", "pluggy._callers", "pytest", "pytestlib", "myapp.views")
+    _process_stacktrace(stacktrace, PytestIntegration())
+    assert [frame["in_app"] for frame in stacktrace["frames"]] == [
+        False,
+        False,
+        False,
+        True,
+        True,
+    ]
+
+
+def test_custom_exclude():
+    integration = PytestIntegration(in_app_exclude=["wrapt", "myapp.testing"])
+    stacktrace = _frames("wrapt.wrappers", "myapp.testing.utils", "myapp.views", "_pytest.runner")
+    _process_stacktrace(stacktrace, integration)
+    assert [frame["in_app"] for frame in stacktrace["frames"]] == [False, False, True, True]
+    assert integration._in_app_cache["wrapt.wrappers"] is False
+
+
+def test_exclude_site_packages():
+    integration = PytestIntegration(exclude_site_packages=True)
+    stacktrace = {
+        "frames": [
+            {"module": "requests.api", "abs_path": "/venv/lib/python3.12/site-packages/requests/api.py"},
+            {"module": "myapp.views", "abs_path": "/src/myapp/views.py"},
+        ]
+    }
+    _process_stacktrace(stacktrace, integration)
+    assert [frame["in_app"] for frame in stacktrace["frames"]] == [False, True]
@@ -0,0 +1,28 @@
+from pytest_sentry import helpers
+from pytest_sentry.integration import PytestIntegration
+
+
+def test_no_dsn(monkeypatch):
+    monkeypatch.delenv("PYTEST_SENTRY_DSN", raising=False)
+    monkeypatch.delenv("SENTRY_DSN", raising=False)
+    scope = helpers._resolve_scope_marker_value_uncached(None)
+    assert scope.client.get_integration(PytestIntegration) is None
+    assert not scope.client.is_active()
+
+
+def test_default_scope_with_dsn(monkeypatch):
+    monkeypatch.setenv("PYTEST_SENTRY_DSN", "https://public@sentry.invalid/1")
+    monkeypatch.setattr(helpers, "_default_isolation_scope", None)
+    scope = helpers._resolve_scope_marker_value_uncached(None)
+    assert scope is helpers.DEFAULT_ISOLATION_SCOPE
+    assert scope.client.get_integration(PytestIntegration) is not None
+
+
+def test_default_scope_with_sentry_dsn(monkeypatch):
+    monkeypatch.delenv("PYTEST_SENTRY_DSN", raising=False)
+    monkeypatch.setenv("SENTRY_DSN", "https://public@sentry.invalid/1")
+    monkeypatch.setattr(helpers, "_default_isolation_scope", None)
+    scope = helpers._resolve_scope_marker_value_uncached(None)
+    assert scope is helpers.DEFAULT_ISOLATION_SCOPE
+    assert scope.client.dsn == "https://public@sentry.invalid/1"
+    assert scope.client.get_integration(PytestIntegration) is not None
@@ -0,0 +1,47 @@
+from pytest_sentry.integration import PytestIntegration
+
+
+TEST_MODULE = """
+import time
+
+import pytest
+
+
+def hot_loop():
+    deadline = time.time() + 0.3
+    while time.time() < deadline:
+        pass
+
+
+@pytest.mark.sentry_profile
+def test_profiled():
+    hot_loop()
+
+
+def test_not_profiled():
+    hot_loop()
+"""
+
+
+def test_hotspots(pytester, sentry_events):
+    pytester.makepyfile(TEST_MODULE)
+
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider")
+    result.assert_outcomes(passed=2)
+    result.stdout.fnmatch_lines([
+        "pytest-sentry: hottest functions in 1 profiled tests (* samples)",
+        "     self    total  function",
+        "  *%  *%  test_hotspots.hot_loop",
+    ])
+
+    (transaction,) = [t for t in sentry_events.transactions() if t["transaction"] == "pytest.profile"]
+    data = transaction["contexts"]["trace"]["data"]
+    assert data["pytest-sentry.profile.tests"] == 1
+    assert data["pytest-sentry.profile.samples"] > 0
+    assert data["pytest-sentry.profile.hotspots"][0].endswith(": test_hotspots.hot_loop")
+
+
+def test_hotspot_sample_rate(monkeypatch):
+    monkeypatch.setenv("PYTEST_SENTRY_HOTSPOT_SAMPLE_RATE", "0.25")
+    assert PytestIntegration().hotspot_sample_rate == 0.25
+    assert PytestIntegration(hotspot_sample_rate=1.0).hotspot_sample_rate == 1.0
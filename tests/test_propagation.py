@@ -0,0 +1,65 @@
+TEST_MODULE = """
+import multiprocessing
+import subprocess
+import sys
+
+
+def burn(_):
+    return sum(range(10 ** 6))
+
+
+def test_subprocess():
+    subprocess.run([sys.executable, "-c", "sum(range(10 ** 6))"], check=True)
+
+
+def _run_pool(context):
+    # Leaving the pool's `with` block terminates the workers before they
+    # can report, so close it instead.
+    pool = multiprocessing.get_context(context).Pool(1)
+    pool.map(burn, [1])
+    pool.close()
+    pool.join()
+
+
+def test_fork():
+    _run_pool("fork")
+
+
+def test_spawn():
+    _run_pool("spawn")
+"""
+
+
+def test_propagation(pytester, monkeypatch, sentry_spool):
+    pytester.makepyfile(test_children=TEST_MODULE)
+    monkeypatch.setenv("PYTEST_SENTRY_DSN", "https://key@sentry.invalid/1")
+    monkeypatch.setenv("PYTEST_SENTRY_PROPAGATE_SUBPROCESSES", "1")
+
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider")
+    result.assert_outcomes(passed=3)
+
+    transactions = sentry_spool.transactions()
+
+    calls = {
+        t["transaction"].rsplit("::", 1)[1]: t["contexts"]["trace"]
+        for t in transactions
+        if t["contexts"]["trace"]["op"] == "pytest.runtest.call"
+    }
+    children = [t for t in transactions if t["contexts"]["trace"]["op"] == "pytest.subprocess"]
+
+    def child_names(test):
+        call = calls[test]
+        return sorted(
+            t["transaction"] for t in children
+            if t["contexts"]["trace"]["trace_id"] == call["trace_id"]
+            and t["contexts"]["trace"]["parent_span_id"] == call["span_id"]
+        )
+
+    (name,) = child_names("test_subprocess")
+    assert name.endswith(" -c sum(range(10 ** 6))")
+    (name,) = child_names("test_fork")
+    assert name.startswith("ForkPoolWorker-")
+    # Spawning also starts the resource tracker process
+    assert any(name.startswith("SpawnPoolWorker-") for name in child_names("test_spawn"))
+
+    assert calls["test_subprocess"]["data"]["pytest-sentry.subprocess.cpu.user"] > 0
@@ -0,0 +1,98 @@
+import gc
+import tracemalloc
+
+import pytest
+import pytest_sentry
+from pytest_sentry.integration import PytestIntegration
+from pytest_sentry.resources import ResourceUsage
+
+import sentry_sdk
+
+
+transactions = []
+leaked_files = []
+
+
+class MyTransport(sentry_sdk.Transport):
+    def __init__(self):
+        pass
+
+    def capture_envelope(self, envelope):
+        transactions.append(envelope.get_transaction_event())
+
+
+GLOBAL_CLIENT = pytest_sentry.Client(transport=MyTransport())
+
+FDS_CLIENT = pytest_sentry.Client(
+    transport=MyTransport(), integrations=[PytestIntegration(resource_collectors=["fds"])]
+)
+
+pytestmark = pytest.mark.sentry_client(GLOBAL_CLIENT)
+
+
+def test_resource_usage():
+    usage = ResourceUsage()
+    usage.start()
+    gc.collect()
+    attributes = usage.stop()
+
+    assert attributes["pytest-sentry.gc.collections"] >= 1
+    assert attributes["pytest-sentry.gc.time"] > 0
+    assert "pytest-sentry.tracemalloc.peak" not in attributes
+    assert "pytest-sentry.fds.delta" not in attributes
+
+
+def test_tracemalloc_without_reset_peak(monkeypatch):
+    # Like Python 3.8
+    monkeypatch.delattr(tracemalloc, "reset_peak")
+    tracemalloc.start()
+    try:
+        usage = ResourceUsage(["tracemalloc"])
+        usage.start()
+        attributes = usage.stop()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+    assert "pytest-sentry.tracemalloc.peak" not in attributes
+
+
+def test_resource_collectors_envvar(monkeypatch):
+    monkeypatch.setenv("PYTEST_SENTRY_RESOURCE_COLLECTORS", "tracemalloc, fds")
+    assert PytestIntegration().resource_collectors == frozenset(["tracemalloc", "fds"])
+
+
+@pytest.mark.sentry_client(FDS_CLIENT)
+def test_fds_collector():
+    pass
+
+
+@pytest.mark.sentry_resources
+def test_leaky():
+    leaked_files.append(open(__file__))
+    data = [0] * 1000000
+    del data
+
+
+@pytest.fixture(scope="module", autouse=True)
+def assert_report():
+    yield
+
+    for f in leaked_files:
+        f.close()
+
+    by_name = {transaction["transaction"]: transaction for transaction in transactions}
+
+    fixture_data = by_name["pytest.fixture.setup assert_report"]["contexts"]["trace"]["data"]
+    assert fixture_data["pytest-sentry.cpu.user"] >= 0
+    assert "pytest-sentry.tracemalloc.peak" not in fixture_data
+
+    leaky_data = by_name["pytest.runtest.call tests/test_resources.py::test_leaky"]["contexts"]["trace"]["data"]
+    assert leaky_data["pytest-sentry.fds.delta"] == 1
+    assert leaky_data["pytest-sentry.tracemalloc.peak"] >= 8000000
+    assert "pytest-sentry.rss.peak_delta" in leaky_data
+    assert "pytest-sentry.gc.collections" in leaky_data
+
+    fds_data = by_name["pytest.runtest.call tests/test_resources.py::test_fds_collector"]["contexts"]["trace"]["data"]
+    assert fds_data["pytest-sentry.fds.delta"] == 0
+    assert "pytest-sentry.tracemalloc.peak" not in fds_data
@@ -0,0 +1,122 @@
+import pytest
+
+from pytest_sentry.__main__ import main
+from pytest_sentry.runstore import RunStore
+
+
+TEST_MODULE = """
+import os
+import time
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def slow_fixture():
+    time.sleep(0.05)
+
+
+def test_slow(slow_fixture):
+    pass
+
+
+def test_flaky():
+    assert os.environ["RUN"] != "1"
+
+
+def test_fails():
+    raise ValueError()
+"""
+
+
+def test_run_store(pytester, monkeypatch, capsys):
+    path = pytester.path / "runs.db"
+    pytester.makepyfile(TEST_MODULE)
+    monkeypatch.setenv("PYTEST_SENTRY_STORE_PATH", str(path))
+
+    for run in range(3):
+        monkeypatch.setenv("RUN", str(run))
+        result = pytester.runpytest_subprocess("-p", "no:cacheprovider")
+        result.assert_outcomes(passed=1 if run == 1 else 2, failed=2 if run == 1 else 1)
+
+    store = RunStore(str(path))
+
+    (fixture,) = [row for row in store.slowest_fixtures() if row[1] == "slow_fixture"]
+    baseid, argname, scope, setups, mean, maximum, per_run = fixture
+    assert baseid == "test_run_store.py"
+    assert scope == "module"
+    assert setups == 3
+    assert mean >= 0.05
+
+    assert store.flakiest_tests() == [("test_run_store.py::test_flaky", 3, 1, 0, 1)]
+
+    trend = store.trend("test_run_store.py::test_fails")
+    assert [row[1] for row in trend] == ["failed"] * 3
+    assert all(row[4] is not None for row in trend)
+
+    (fingerprint,) = store._query("SELECT DISTINCT fingerprint FROM tests WHERE nodeid LIKE '%test_fails'")
+    assert fingerprint[0].startswith("builtins.ValueError at test_run_store.py:")
+    assert fingerprint[0].endswith(" in test_fails")
+
+    assert main(["flakiest", "--runs", "2"]) == 0
+    out = capsys.readouterr().out
+    assert "50%" in out
+    assert "test_run_store.py::test_flaky" in out
+
+    assert main(["trend", "test_run_store.py::test_flaky"]) == 0
+    out = capsys.readouterr().out
+    assert [line.split()[-1] for line in out.splitlines()[1:]] == ["passed", "failed", "passed"]
+
+    assert main(["slowest-fixtures", "--limit", "1"]) == 0
+    assert "test_run_store.py::slow_fixture (module)" in capsys.readouterr().out
+
+
+def test_run_store_reruns(pytester, monkeypatch):
+    pytest.importorskip("pytest_rerunfailures")
+
+    path = pytester.path / "runs.db"
+    pytester.makepyfile(
+        """
+        import os
+
+        def test_flaky():
+            marker = os.path.join(os.path.dirname(__file__), "ran")
+            if not os.path.exists(marker):
+                open(marker, "w").close()
+                assert False
+        """
+    )
+
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider", "--reruns", "1", "--sentry-store", str(path))
+    assert result.parseoutcomes() == {"passed": 1, "rerun": 1}
+
+    assert RunStore(str(path)).flakiest_tests() == [("test_run_store_reruns.py::test_flaky", 1, 1, 1, 0)]
+
+
+def test_run_store_xdist(pytester):
+    pytest.importorskip("xdist")
+
+    path = pytester.path / "runs.db"
+    pytester.makepyfile(
+        """
+        import pytest
+
+        @pytest.mark.parametrize("i", range(4))
+        def test_param(i):
+            pass
+        """
+    )
+
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider", "-n", "2", "--sentry-store", str(path))
+    result.assert_outcomes(passed=4)
+
+    store = RunStore(str(path))
+    assert store._query("SELECT COUNT(*) FROM runs") == [(1,)]
+    assert store._query("SELECT COUNT(*), COUNT(DISTINCT run_id) FROM tests") == [(4, 1)]
+    assert len(store.trend("test_run_store_xdist.py::test_param[0]")) == 1
+
+
+def test_cli_requires_store(monkeypatch):
+    monkeypatch.delenv("PYTEST_SENTRY_STORE_PATH", raising=False)
+    with pytest.raises(SystemExit, match="PYTEST_SENTRY_STORE_PATH"):
+        main(["flakiest"])
@@ -0,0 +1,101 @@
+import datetime
+import time
+
+import pytest
+import pytest_sentry
+from pytest_sentry.integration import PytestIntegration
+
+import sentry_sdk
+
+
+transactions = []
+sampling_contexts = []
+
+
+class MyTransport(sentry_sdk.Transport):
+    def __init__(self):
+        pass
+
+    def capture_envelope(self, envelope):
+        transactions.append(envelope.get_transaction_event())
+
+
+def _parse_timestamp(value):
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def span_sampler(sampling_context):
+    sampling_contexts.append(sampling_context)
+    if sampling_context["fixture_name"] == "dropped_fixture":
+        return False
+    return None
+
+
+SAMPLING_CLIENT = pytest_sentry.Client(
+    transport=MyTransport(),
+    integrations=[PytestIntegration(span_sampler=span_sampler, fixture_scopes=["function"])],
+)
+DURATION_CLIENT = pytest_sentry.Client(
+    transport=MyTransport(),
+    integrations=[PytestIntegration(fixture_min_duration=0.05)],
+)
+
+
+@pytest.fixture
+def kept_fixture():
+    return 1
+
+
+@pytest.fixture
+def dropped_fixture():
+    return 2
+
+
+@pytest.fixture(scope="module")
+def module_fixture():
+    return 3
+
+
+@pytest.fixture
+def fast_fixture():
+    return 4
+
+
+@pytest.fixture
+def slow_fixture():
+    time.sleep(0.06)
+    return 5
+
+
+@pytest.mark.sentry_client(SAMPLING_CLIENT)
+def test_sampler(kept_fixture, dropped_fixture, module_fixture):
+    pass
+
+
+@pytest.mark.sentry_client(DURATION_CLIENT)
+def test_min_duration(fast_fixture, slow_fixture):
+    pass
+
+
+@pytest.fixture(scope="module", autouse=True)
+def assert_report():
+    yield
+
+    assert [transaction["transaction"] for transaction in transactions] == [
+        "pytest.fixture.setup kept_fixture",
+        "pytest.runtest.call tests/test_sampling.py::test_sampler",
+        "pytest.fixture.setup slow_fixture",
+        "pytest.runtest.call tests/test_sampling.py::test_min_duration",
+    ]
+
+    call_context = sampling_contexts[-1]
+    assert call_context["op"] == "pytest.runtest.call"
+    assert call_context["nodeid"] == "tests/test_sampling.py::test_sampler"
+    assert "sentry_client" in call_context["markers"]
+    assert call_context["fixture_scope"] is None
+
+    slow_fixture_transaction = transactions[2]
+    duration = _parse_timestamp(slow_fixture_transaction["timestamp"]) - _parse_timestamp(
+        slow_fixture_transaction["start_timestamp"]
+    )
+    assert duration.total_seconds() >= 0.05
@@ -0,0 +1,33 @@
+import pytest
+import pytest_sentry
+
+from pytest_sentry import helpers
+
+
+GLOBAL_CLIENT = pytest_sentry.Client()
+
+pytestmark = pytest.mark.sentry_client(GLOBAL_CLIENT)
+
+
+def test_resolved_once_per_item(request, sentry_test_scope):
+    assert request.node.stash[helpers._item_isolation_scope_key] is sentry_test_scope
+    assert helpers._resolve_item_scope(request.node) is sentry_test_scope
+
+
+def test_marker_identity():
+    a = pytest.mark.sentry_client({"traces_sample_rate": 0.0}).mark
+    b = pytest.mark.sentry_client({"traces_sample_rate": 0.0}).mark
+
+    scope_a = helpers._resolve_scope_marker_value(a)
+    assert helpers._resolve_scope_marker_value(a) is scope_a
+    assert helpers._resolve_scope_marker_value(b) is not scope_a
+
+
+def test_eviction(monkeypatch):
+    monkeypatch.setattr(helpers, "_ISOLATION_SCOPE_CACHE_MAXSIZE", 2)
+    markers = [pytest.mark.sentry_client(GLOBAL_CLIENT).mark for _ in range(5)]
+    for marker in markers:
+        helpers._resolve_scope_marker_value(marker)
+
+    assert len(helpers._isolation_scope_cache) <= 2
+    assert helpers._isolation_scope_cache[id(markers[-1])][0] is markers[-1]
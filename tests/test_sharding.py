@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from pytest_sentry.sharding import parse_shard
+
+
+TEST_MODULE = """
+import time
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def expensive():
+    time.sleep(0.2)
+
+
+def test_a():
+    time.sleep(0.1)
+
+
+def test_b():
+    pass
+
+
+def test_c(expensive):
+    pass
+
+
+def test_d(expensive):
+    pass
+"""
+
+
+def test_parse_shard():
+    assert parse_shard("2/3") == (2, 3)
+    for value in ["0/3", "4/3", "1", "a/b"]:
+        with pytest.raises(pytest.UsageError):
+            parse_shard(value)
+
+
+def test_record_durations(pytester):
+    path = pytester.path / "durations.json"
+    pytester.makepyfile(test_durations=TEST_MODULE)
+
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider", "--sentry-durations", str(path))
+    result.assert_outcomes(passed=4)
+
+    index = json.loads(path.read_text())
+    assert index["tests"]["test_durations.py::test_a"] >= 0.1
+    # Setting up the shared fixture is not part of the test's duration
+    assert index["tests"]["test_durations.py::test_c"] < 0.1
+    assert index["fixtures"]["test_durations.py::expensive"] >= 0.2
+
+
+INDEX = {
+    "version": 1,
+    "tests": {
+        "test_shards.py::test_a": 0.3,
+        "test_shards.py::test_b": 0.2,
+        "test_shards.py::test_c": 0.0,
+        "test_shards.py::test_d": 0.0,
+    },
+    "fixtures": {"test_shards.py::expensive": 0.4},
+}
+
+
+def _run_shard(pytester, path, shard):
+    path.write_text(json.dumps(INDEX))
+    result = pytester.runpytest_subprocess(
+        "-p", "no:cacheprovider", "-v", "--sentry-durations", str(path), "--sentry-shard", shard
+    )
+    return sorted(
+        line.split("::")[1].split()[0] for line in result.outlines if "PASSED" in line
+    )
+
+
+def test_shards(pytester):
+    path = pytester.path / "durations.json"
+    pytester.makepyfile(test_shards=TEST_MODULE)
+
+    # test_c and test_d share the expensive fixture, so they end up together
+    assert _run_shard(pytester, path, "1/2") == ["test_c", "test_d"]
+    assert _run_shard(pytester, path, "2/2") == ["test_a", "test_b"]
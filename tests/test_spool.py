@@ -0,0 +1,164 @@
+import gzip
+import http.server
+import json
+import threading
+
+import pytest
+import pytest_sentry
+from pytest_sentry.__main__ import main
+from pytest_sentry.spool import SpoolTransport, upload_spool
+
+import sentry_sdk
+from sentry_sdk.envelope import Envelope
+from sentry_sdk.scope import ScopeType
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = gzip.decompress(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.path, self.headers, body))
+        failed = self.server.fail_after is not None and len(self.server.requests) > self.server.fail_after
+        self.send_response(503 if failed else self.server.status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.requests = []
+    server.status = 200
+    server.fail_after = None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _dsn(server):
+    return "http://public@127.0.0.1:{}/42".format(server.server_address[1])
+
+
+def _spool_messages(tmp_path, dsn, count):
+    client = pytest_sentry.Client(dsn=dsn, transport=SpoolTransport({"dsn": dsn}, spool_dir=str(tmp_path)))
+    scope = sentry_sdk.Scope(ty=ScopeType.ISOLATION)
+    scope.set_client(client)
+    with sentry_sdk.use_isolation_scope(scope):
+        for i in range(count):
+            sentry_sdk.capture_message("hi {}".format(i))
+    client.close()
+
+
+def test_selected_by_envvar(sentry_spool):
+    client = pytest_sentry.Client(dsn="http://public@127.0.0.1:1/42")
+    assert isinstance(client.transport, SpoolTransport)
+    assert client.transport.spool_dir == str(sentry_spool.path)
+
+
+def test_spool_from_threads(sentry_spool):
+    transport = SpoolTransport({"dsn": "http://public@127.0.0.1:1/42"}, spool_dir=str(sentry_spool.path))
+
+    def capture(thread):
+        for i in range(2000):
+            envelope = Envelope()
+            envelope.add_checkin({"check_in_id": "{:016x}{:016x}".format(thread, i), "status": "ok"})
+            transport.capture_envelope(envelope)
+
+    threads = [threading.Thread(target=capture, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    transport.kill()
+
+    assert len(list(sentry_spool.path.glob("*.segment"))) == 1
+    check_in_ids = [json.loads(envelope.items[0].get_bytes())["check_in_id"] for envelope in sentry_spool.read()]
+    assert sorted(check_in_ids) == sorted("{:016x}{:016x}".format(t, i) for t in range(8) for i in range(2000))
+
+
+def test_upload(tmp_path, stub_server):
+    _spool_messages(tmp_path, _dsn(stub_server), 3)
+    assert len(list(tmp_path.glob("*.segment"))) == 1
+
+    assert upload_spool(str(tmp_path)) == (3, 0)
+
+    assert len(stub_server.requests) == 3
+    path, headers, body = stub_server.requests[0]
+    assert path == "/api/42/envelope/"
+    assert "sentry_key=public" in headers["X-Sentry-Auth"]
+    assert b'"hi 0"' in body
+    assert not list(tmp_path.iterdir())
+
+
+def test_upload_resumes(tmp_path, stub_server):
+    _spool_messages(tmp_path, _dsn(stub_server), 2)
+
+    stub_server.status = 503
+    assert upload_spool(str(tmp_path)) == (0, 2)
+
+    stub_server.status = 200
+    assert main(["upload-spool", str(tmp_path)]) == 0
+    assert [body.count(b'"hi ') for _, _, body in stub_server.requests[1:]] == [1, 1]
+    assert not list(tmp_path.iterdir())
+
+
+def test_upload_resumes_mid_segment(tmp_path, stub_server):
+    _spool_messages(tmp_path, _dsn(stub_server), 4)
+
+    stub_server.fail_after = 2
+    assert upload_spool(str(tmp_path)) == (2, 2)
+    assert list(tmp_path.glob("*.offset"))
+
+    stub_server.fail_after = None
+    assert upload_spool(str(tmp_path)) == (2, 0)
+    # The rejected third envelope is sent again, the first two are not
+    messages = [Envelope.deserialize(body).get_event()["message"] for _, _, body in stub_server.requests]
+    assert messages == ["hi 0", "hi 1", "hi 2", "hi 2", "hi 3"]
+    assert not list(tmp_path.iterdir())
+
+
+def test_upload_through_proxy(tmp_path, stub_server, monkeypatch):
+    monkeypatch.delenv("NO_PROXY", raising=False)
+    monkeypatch.delenv("no_proxy", raising=False)
+    _spool_messages(tmp_path, "http://public@sentry.invalid/42", 1)
+
+    proxy = "http://127.0.0.1:{}".format(stub_server.server_address[1])
+    assert main(["upload-spool", str(tmp_path), "--http-proxy", proxy]) == 0
+
+    ((path, headers, body),) = stub_server.requests
+    assert path == "http://sentry.invalid/api/42/envelope/"
+    assert b'"hi 0"' in body
+
+
+def test_upload_skips_segments_being_written(tmp_path, stub_server):
+    transport = SpoolTransport({"dsn": _dsn(stub_server)}, spool_dir=str(tmp_path))
+    envelope = Envelope()
+    envelope.add_checkin({"check_in_id": "0" * 32, "status": "ok"})
+    transport.capture_envelope(envelope)
+
+    assert upload_spool(str(tmp_path)) == (0, 1)
+    assert not stub_server.requests
+    assert list(tmp_path.glob("*.segment"))
+
+    transport.kill()
+    assert upload_spool(str(tmp_path)) == (1, 0)
+    assert not list(tmp_path.iterdir())
+
+
+def test_upload_merges(tmp_path, stub_server):
+    transport = SpoolTransport({"dsn": _dsn(stub_server)}, spool_dir=str(tmp_path))
+    for i in range(5):
+        envelope = Envelope()
+        envelope.add_checkin({"check_in_id": "{:032x}".format(i), "status": "ok"})
+        transport.capture_envelope(envelope)
+    transport.kill()
+
+    assert upload_spool(str(tmp_path)) == (5, 0)
+
+    ((_, headers, body),) = stub_server.requests
+    assert headers["Content-Encoding"] == "gzip"
+    assert [item.type for item in Envelope.deserialize(body).items] == ["check_in"] * 5
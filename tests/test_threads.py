@@ -0,0 +1,65 @@
+TEST_MODULE = """
+import concurrent.futures
+import threading
+import time
+
+import sentry_sdk
+
+executor = concurrent.futures.ThreadPoolExecutor(1)
+# The worker thread exists before the test starts
+executor.submit(lambda: None).result()
+
+
+def work():
+    with sentry_sdk.start_span(op="test.work", name="work"):
+        end = time.thread_time() + 0.05
+        while time.thread_time() < end:
+            pass
+
+
+def report():
+    sentry_sdk.capture_message("from thread")
+
+
+def test_threads():
+    threads = [threading.Thread(target=work, name="worker-{}".format(i)) for i in range(2)]
+    threads.append(threading.Thread(target=report, name="reporter"))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    executor.submit(work).result()
+"""
+
+
+def test_threads(pytester, sentry_events):
+    sentry_events.configure(propagate_to_threads=True)
+    pytester.makepyfile(TEST_MODULE)
+
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider")
+    result.assert_outcomes(passed=1)
+
+    (call,) = [t for t in sentry_events.transactions() if t["transaction"].startswith("pytest.runtest.call")]
+    (message,) = [e for e in sentry_events.errors() if e.get("message") == "from thread"]
+    trace = call["contexts"]["trace"]
+
+    data = trace["data"]
+    assert data["pytest-sentry.threads.started"] == 3
+    assert data["pytest-sentry.threads.tasks"] == 1
+    assert data["pytest-sentry.threads.cpu"] >= 0.15
+    assert data["pytest-sentry.threads.busy"] >= data["pytest-sentry.threads.cpu"]
+
+    spans = call["spans"]
+    assert sorted(span["description"] for span in spans if span["op"] == "thread") == [
+        "reporter", "worker-0", "worker-1"
+    ]
+    (task,) = [span for span in spans if span["op"] == "thread.task"]
+    assert task["description"] == "work"
+    assert task["data"]["pytest-sentry.cpu"] >= 0.05
+
+    # Spans and events from threads belong to the test
+    work_spans = [span for span in spans if span["op"] == "test.work"]
+    assert len(work_spans) == 3
+    assert all(span["parent_span_id"] == trace["span_id"] for span in work_spans)
+    assert message["contexts"]["trace"]["trace_id"] == trace["trace_id"]
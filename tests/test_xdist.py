@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("xdist")
+
+
+TEST_MODULE = """
+import pytest
+
+
+@pytest.mark.parametrize("i", range(4))
+def test_foo(i):
+    pass
+"""
+
+
+def test_one_trace_across_workers(pytester, sentry_events):
+    pytester.makepyfile(TEST_MODULE)
+
+    result = pytester.runpytest_subprocess("-n", "2", "-p", "no:cacheprovider")
+    result.assert_outcomes(passed=4)
+
+    transactions = sentry_events.transactions()
+    calls = [t for t in transactions if t["transaction"].startswith("pytest.runtest.call")]
+    assert len(calls) == 4
+    assert len({t["contexts"]["trace"]["trace_id"] for t in transactions}) == 1
+    assert {t["tags"]["pytest.xdist.worker"] for t in calls} <= {"gw0", "gw1"}